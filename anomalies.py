@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from cache import LRUCache
+
+ANOMALY_FEATURES = ["Revenu", "Marge"]
+CONTAMINATION = 0.05
+# Taille maximale de l'échantillon d'entraînement : au-delà, le modèle n'apprend
+# rien de plus mais l'ajustement coûte proportionnellement plus cher
+MAX_TRAIN_ROWS = 100_000
+MIN_ROWS = 20
+RANDOM_STATE = 0
+
+# Octets par nœud d'arbre scikit-learn (structure du nœud + valeur)
+TREE_NODE_BYTES = 72
+ANOMALY_CACHE_BUDGET = int(os.environ.get("ANOMALY_CACHE_MB", "128")) * 1024 * 1024
+
+# Un modèle par jeu de données, partagé par les reruns et les sessions, pesé par ses arbres
+detector_cache = LRUCache(budget_bytes=64 * 1024 * 1024, max_entries=8)
+# Lignes anormales par (modèle, état des filtres), bornées en octets
+anomaly_cache = LRUCache(budget_bytes=ANOMALY_CACHE_BUDGET)
+
+
+def anomaly_features(df):
+    return df[ANOMALY_FEATURES].astype("float64").fillna(0).to_numpy()
+
+
+class AnomalyDetector:
+    # IsolationForest déterministe, entraîné une fois sur un sous-échantillon borné ;
+    # l'évaluation de n'importe quelles lignes (filtrées ou ajoutées) n'est qu'un predict.
+
+    def __init__(self, contamination=CONTAMINATION, max_train_rows=MAX_TRAIN_ROWS, random_state=RANDOM_STATE):
+        self.contamination = contamination
+        self.max_train_rows = max_train_rows
+        self.random_state = random_state
+        self.model = None
+        self.train_rows = 0
+
+    def fit(self, df):
+        # scikit-learn n'est chargé qu'au premier entraînement
+        from sklearn.ensemble import IsolationForest
+
+        X = anomaly_features(df)
+        if len(X) > self.max_train_rows:
+            rng = np.random.default_rng(self.random_state)
+            X = X[rng.choice(len(X), self.max_train_rows, replace=False)]
+        self.model = IsolationForest(
+            contamination=self.contamination, random_state=self.random_state, n_jobs=-1
+        ).fit(X)
+        self.train_rows = len(X)
+        return self
+
+    @property
+    def nbytes(self):
+        if self.model is None:
+            return 0
+        return sum(tree.tree_.node_count for tree in self.model.estimators_) * TREE_NODE_BYTES
+
+    def predict(self, df):
+        # True pour les lignes jugées anormales
+        if not len(df):
+            return np.zeros(0, dtype=bool)
+        return self.model.predict(anomaly_features(df)) == -1
+
+    def detect(self, df):
+        return df[self.predict(df)]
+
+
+def get_detector(dataset_key, df):
+    # df : lignes d'entraînement, ou fonction qui les produit (appelée seulement sans modèle en cache)
+    return detector_cache.get_or_compute(
+        ("detector", dataset_key), lambda: AnomalyDetector().fit(df() if callable(df) else df)
+    )
+
+
+def detect_anomalies(df_filtered, detector):
+    # detector : modèle, ou fonction qui le fournit (appelée seulement s'il y a assez de lignes)
+    if len(df_filtered) > MIN_ROWS:
+        return (detector() if callable(detector) else detector).detect(df_filtered)
+    return pd.DataFrame()
+
+
+def cached_anomalies(dataset_key, filter_key, n_rows, training_rows, detect):
+    # Aucun entraînement si la sélection est trop petite ; sinon `detect(detector)`
+    # est mémorisé par (modèle, état des filtres)
+    if n_rows <= MIN_ROWS:
+        return pd.DataFrame()
+    return anomaly_cache.get_or_compute(
+        (("detector", dataset_key), filter_key), lambda: detect(get_detector(dataset_key, training_rows))
+    )
@@ -1,11 +1,12 @@
 import streamlit as st
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from fpdf import FPDF
-import tempfile
 import io
 
+from charts import downsample_series
+from exports import build_pdf, export_table
+from ingestion import load_raw, load_standardized, read_upload
+
 st.set_page_config(page_title="Analyse ventes contrat", layout="wide")
 st.title("📊 Analyse des Ventes - Contrats et Assurances")
 
@@ -18,31 +19,10 @@ def detect_column(possible_names, df_cols):
                 return col
     return None
 
-def create_pdf_with_images(summary_text, image_buffers):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-
-    for line in summary_text.split('\n'):
-        pdf.cell(0, 10, line, ln=True)
-
-    for img_buf in image_buffers:
-        tmp_img = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-        tmp_img.write(img_buf.getbuffer())
-        tmp_img.close()
-        pdf.image(tmp_img.name, w=180)
-        pdf.ln(10)
-
-    tmp_pdf = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    pdf.output(tmp_pdf.name)
-    return tmp_pdf.name
-
 if uploaded_file:
     try:
-        if uploaded_file.name.endswith(".csv"):
-            df = pd.read_csv(uploaded_file)
-        else:
-            df = pd.read_excel(uploaded_file)
+        file_bytes, file_key = read_upload(uploaded_file, st.session_state)
+        df = load_raw(uploaded_file.name, file_bytes, file_key)
 
         st.subheader("Aperçu du fichier")
         st.dataframe(df.head())
@@ -72,12 +52,15 @@ if uploaded_file:
         col_assureur = st.selectbox("Colonne Part Assureur", df_cols, index=df_cols.index(col_assureur) if col_assureur else 0)
         col_distrib = st.selectbox("Colonne de Distributeur", df_cols, index=df_cols.index(col_distrib) if col_distrib else 0)
 
-        df["Date"] = pd.to_datetime(df[col_date], dayfirst=True, errors='coerce')
-        df["Revenu"] = pd.to_numeric(df[col_revenu], errors='coerce')
-        df["Marge"] = pd.to_numeric(df[col_marge], errors='coerce')
-        df["Produit"] = df[col_produit].astype(str)
-        df["Assureur"] = pd.to_numeric(df[col_assureur], errors='coerce')
-        df["Distributeur"] = df[col_distrib].astype(str)
+        columns_mapping = {
+            "date": col_date,
+            "revenu": col_revenu,
+            "marge": col_marge,
+            "produit": col_produit,
+            "assureur": col_assureur,
+            "distributeur": col_distrib,
+        }
+        df = load_standardized(uploaded_file.name, file_bytes, columns_mapping, file_key)
 
         st.sidebar.header("🎛️ Filtres")
         min_date, max_date = df["Date"].min().date(), df["Date"].max().date()
@@ -122,7 +105,8 @@ if uploaded_file:
 
         st.markdown("### 📆 Évolution du revenu par date")
         revenu_par_jour = df_filtered.groupby(df_filtered["Date"].dt.date)["Revenu"].sum()
-        st.line_chart(revenu_par_jour)
+        # Réduction LTTB au budget de points avant envoi au navigateur
+        st.line_chart(downsample_series(revenu_par_jour))
 
         st.markdown("### 🥇 Top 10 Produits par Revenu")
         top_produits = df_filtered.groupby("Produit")["Revenu"].sum().sort_values(ascending=False).head(10)
@@ -147,12 +131,8 @@ if uploaded_file:
 
         @st.cache_data
         def to_excel(data):
-            from io import BytesIO
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                data.to_excel(writer, index=False, sheet_name='Analyse')
-            output.seek(0)
-            return output
+            # Écriture ligne à ligne en mémoire constante, découpée au-delà d'une feuille Excel
+            return export_table(data, "xlsx")[0]
 
         excel_data = to_excel(df_filtered)
 
@@ -187,14 +167,13 @@ if uploaded_file:
         buf2.seek(0)
 
         if st.button("📄 Télécharger le rapport PDF complet"):
-            pdf_path = create_pdf_with_images(summary_text, [buf1, buf2])
-            with open(pdf_path, "rb") as f:
-                st.download_button(
-                    label="📥 Télécharger le PDF",
-                    data=f.read(),
-                    file_name="rapport_complet_ventes.pdf",
-                    mime="application/pdf"
-                )
+            pdf_bytes = build_pdf(summary_text, [buf1, buf2], gap=10)
+            st.download_button(
+                label="📥 Télécharger le PDF",
+                data=pdf_bytes,
+                file_name="rapport_complet_ventes.pdf",
+                mime="application/pdf"
+            )
 
     except Exception as e:
         st.error(f"❌ Erreur lors de la lecture ou de l’analyse du fichier : {e}")
@@ -1,167 +1,200 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import seaborn as sns
-import matplotlib.pyplot as plt
-from fpdf import FPDF
-from pptx import Presentation
-from pptx.util import Inches
-import tempfile
-import io
-import numpy as np
-from sklearn.ensemble import IsolationForest
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
-import traceback
+import uuid
+
+from anomalies import cached_anomalies
+from cache import content_hash
+from charts import (
+    MAX_POINTS,
+    forecast_figure,
+    heatmap_figure,
+    monthly_bar_figure,
+    monthly_line_figure,
+    product_share_figure,
+    time_series_figure,
+    top_products_figure,
+)
+from exports import TABLE_FORMATS, cached_export, export_report, figure_key, table_cache
+from forecasting import forecast_revenue, forecast_segments
+from ingestion import (
+    coercion_failures,
+    list_sheets,
+    load_preview,
+    load_raw,
+    read_upload,
+)
+from instrumentation import StageTimer
+from jobs import DONE, PENDING, RUNNING, report_queue
+from pipeline import detect_columns, load_dataset, margin_box, report_summary, summary_kpis
+from queries import aggregation_stats, get_filter_index, query_view
+from sql_backend import choose_backend, get_sql_source, sql_query_view
+from store import data_store
 
 st.set_page_config(page_title="Analyse ventes contrat", layout="wide")
 st.title("📊 Analyse des Ventes - Contrats et Assurances")
 
-# ------------------------
-# FONCTIONS UTILITAIRES
-# ------------------------
-
-def detect_column(possible_names, df_cols):
-    for name in possible_names:
-        for col in df_cols:
-            if name.lower().strip() == col.lower().strip():
-                return col
-    return None
-
-def standardize_columns(df, columns_mapping):
-    df_std = df.copy()
-    try:
-        df_std["Date"] = pd.to_datetime(df[columns_mapping['date']], dayfirst=True, errors="coerce")
-        df_std["Revenu"] = pd.to_numeric(df[columns_mapping['revenu']], errors="coerce")
-        df_std["Marge"] = pd.to_numeric(df[columns_mapping['marge']], errors="coerce")
-        df_std["Produit"] = df[columns_mapping['produit']].astype(str)
-        df_std["Assureur"] = pd.to_numeric(df[columns_mapping['assureur']], errors="coerce")
-        df_std["Distributeur"] = df[columns_mapping['distributeur']].astype(str)
-    except Exception as e:
-        st.error(f"Erreur lors de la standardisation des colonnes: {e}")
-    return df_std
-
-def create_pdf(summary_text, image_buffers):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    for line in summary_text.split("\n"):
-        pdf.cell(0, 10, line, ln=True)
-    for img_buf in image_buffers:
-        tmp_img = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-        tmp_img.write(img_buf.getbuffer())
-        tmp_img.close()
-        pdf.image(tmp_img.name, w=180)
-        pdf.ln(5)
-    tmp_pdf = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    pdf.output(tmp_pdf.name)
-    return tmp_pdf.name
-
-def create_pptx(image_buffers, summary_text):
-    prs = Presentation()
-    slide_layout = prs.slide_layouts[5]
-    slide = prs.slides.add_slide(slide_layout)
-    title = slide.shapes.title
-    title.text = "Rapport de Ventes"
-    left = Inches(0.5)
-    top = Inches(1.5)
-    width = Inches(9)
-    height = Inches(1)
-    txBox = slide.shapes.add_textbox(left, top, width, height)
-    tf = txBox.text_frame
-    for line in summary_text.split("\n"):
-        tf.add_paragraph().text = line
-    for img_buf in image_buffers:
-        slide = prs.slides.add_slide(slide_layout)
-        img_file = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-        img_file.write(img_buf.getbuffer())
-        img_file.close()
-        slide.shapes.add_picture(img_file.name, Inches(1), Inches(1), width=Inches(8))
-    tmp_pptx = tempfile.NamedTemporaryFile(delete=False, suffix=".pptx")
-    prs.save(tmp_pptx.name)
-    return tmp_pptx.name
-
-@st.cache_data
-def convert_to_excel(df):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="Analyse")
-    output.seek(0)
-    return output
-
-def forecast_revenue(df_filtered):
-    ts = df_filtered.groupby(df_filtered["Date"].dt.to_period("M"))["Revenu"].sum()
-    ts.index = ts.index.to_timestamp()
-    if len(ts) > 6:
-        model = ExponentialSmoothing(ts, trend="add", seasonal=None)
-        fit = model.fit()
-        forecast = fit.forecast(3)
-        return forecast
-    return None
-
-def detect_anomalies(df_filtered):
-    if len(df_filtered) > 20:
-        X = df_filtered[["Revenu", "Marge"]].fillna(0)
-        clf = IsolationForest(contamination=0.05)
-        preds = clf.fit_predict(X)
-        anomalies = df_filtered[preds == -1]
-        return anomalies
-    return pd.DataFrame()
-
 # ------------------------
 # CHARGEMENT DU FICHIER
 # ------------------------
 
-uploaded_file = st.file_uploader("📂 Téléchargez votre fichier Excel ou CSV", type=["xlsx", "xls", "csv"])
+# Un fichier seul est analysé entièrement en mémoire (pandas) ; au-delà de la
+# mémoire disponible, l'historique local le garde sur disque pour le moteur SQL
+LARGE_FILE_HINT = (
+    "Pour un fichier de cette taille, cochez « 📚 Historique local (plusieurs fichiers) » : "
+    "il y est stocké sur disque et interrogé par le moteur SQL sans être chargé en entier."
+)
+
+# Un fichier analysé seul, ou l'historique local alimenté export après export
+history_mode = st.sidebar.checkbox("📚 Historique local (plusieurs fichiers)", value=False)
+if history_mode:
+    uploaded_files = st.file_uploader(
+        "📂 Ajoutez vos exports Excel ou CSV à l'historique", type=["xlsx", "xls", "csv"], accept_multiple_files=True
+    )
+    has_data = True
+    source_name = "historique"
+else:
+    uploaded_file = st.file_uploader("📂 Téléchargez votre fichier Excel ou CSV", type=["xlsx", "xls", "csv"])
+    has_data = uploaded_file is not None
+    source_name = uploaded_file.name if has_data else None
 
-if uploaded_file:
+# Mode instrumentation : temps, lignes et pic mémoire de chaque étape du rerun
+instrumented = st.sidebar.checkbox("⏱️ Mode instrumentation", value=False)
+timer = StageTimer(enabled=instrumented)
+
+if has_data:
     try:
-        if uploaded_file.name.endswith(".csv"):
-            df = pd.read_csv(uploaded_file)
+        timer.start()
+        if history_mode:
+            # Seuls les fichiers jamais importés sont analysés ; les contrats déjà
+            # présents dans l'historique sont écartés. Chaque fichier déposé n'est
+            # traité qu'une fois par session : les reruns ne relisent ni ne rehachent rien.
+            stored_uploads = st.session_state.setdefault("stored_uploads", {})
+            for stored_file in uploaded_files or []:
+                if stored_file.file_id not in stored_uploads:
+                    try:
+                        entry = data_store.add_file(stored_file.name, stored_file.getvalue())
+                    except Exception as e:
+                        stored_uploads[stored_file.file_id] = ("error", f"❌ {e}")
+                    else:
+                        columns = ", ".join(f"{key} ← {col}" for key, col in entry["mapping"].items())
+                        stored_uploads[stored_file.file_id] = ("success", (
+                            f"✅ {stored_file.name} : {entry['added']:,} contrats ajoutés, "
+                            f"{entry['duplicates']:,} déjà présents ignorés — colonnes : {columns}"
+                            if entry["status"] == "importé" else f"✅ {stored_file.name} : déjà dans l'historique"
+                        ))
+                level, message = stored_uploads[stored_file.file_id]
+                getattr(st, level)(message)
+            manifest = data_store.manifest()
+            with st.sidebar.expander(f"📚 Historique : {len(manifest)} fichier(s)"):
+                if manifest:
+                    st.dataframe(pd.DataFrame(manifest)[["name", "added", "duplicates", "imported_at"]].rename(columns={
+                        "name": "Fichier", "added": "Ajoutés", "duplicates": "Doublons", "imported_at": "Importé le",
+                    }), hide_index=True)
+                if st.button("🗑️ Vider l'historique"):
+                    # Les fichiers encore déposés restent marqués traités : les redéposer pour les réimporter
+                    data_store.clear()
+                    st.rerun()
+            if not manifest:
+                st.info("📚 L'historique est vide : ajoutez un ou plusieurs exports.")
+                st.stop()
+            dataset_key = data_store.version()
+            # Au-delà du seuil, l'historique reste sur disque et est interrogé par le moteur SQL
+            query_backend = choose_backend(data_store.nbytes())
+            if query_backend == "sql":
+                df_std = None
+                sql_data = data_store.dataset()
+            else:
+                # Parties Arrow projetées en mémoire : aucun fichier source n'est relu
+                df_std = data_store.load()
+                timer.lap("chargement de l'historique", rows=len(df_std))
         else:
-            df = pd.read_excel(uploaded_file)
-
-        st.subheader("Aperçu du fichier chargé")
-        st.dataframe(df.head())
-
-        synonyms = {
-            "date": ["date", "date début", "date de vente"],
-            "revenu": ["prime total ttc", "revenu", "ca"],
-            "marge": ["marge", "marge distributeur ttc"],
-            "produit": ["produit", "device", "type", "categorie"],
-            "assureur": ["part assureur", "part", "taux"],
-            "distributeur": ["distributeur", "revendeur", "client", "point de vente"],
-        }
-
-        df_cols = list(df.columns)
-        detected_cols = {
-            key: detect_column(synonyms[key], df_cols) or df_cols[0]
-            for key in synonyms
-        }
-
-        st.markdown("### 🔧 Confirmez ou ajustez les colonnes")
-        for key in detected_cols:
-            detected_cols[key] = st.selectbox(
-                f"Colonne pour {key.capitalize()}",
-                df_cols,
-                index=df_cols.index(detected_cols[key])
-            )
-
-        df_std = standardize_columns(df, detected_cols)
+            file_bytes, file_key = read_upload(uploaded_file, st.session_state)
+            is_csv = uploaded_file.name.endswith(".csv")
+            is_xlsx = uploaded_file.name.endswith(".xlsx")
+            sheet_name = None
+            if is_xlsx:
+                sheets = list_sheets(file_bytes, file_key)
+                sheet_name = st.sidebar.selectbox("📑 Feuille Excel", sheets) if len(sheets) > 1 else sheets[0]
+
+            # Mode compact : colonnes typées au plus juste (catégories, float32), lues en flux
+            # bloc par bloc pour les CSV et les .xlsx ; les colonnes supplémentaires sont gardées
+            # en catégories, sauf si l'utilisateur choisit de les écarter
+            compact = st.sidebar.checkbox("⚡ Mode compact (lecture en flux, types réduits)", value=True)
+            keep_extra = not (compact and st.sidebar.checkbox("✂️ Écarter les colonnes non mappées", value=False))
+            streaming = compact and (is_csv or is_xlsx)
+            if compact:
+                df = load_preview(uploaded_file.name, file_bytes, file_key, sheet_name)
+            else:
+                df = load_raw(uploaded_file.name, file_bytes, file_key, sheet_name)
+
+            st.subheader("Aperçu du fichier chargé")
+            st.dataframe(df.head())
+            timer.lap("aperçu", rows=len(df))
+
+            df_cols = list(df.columns)
+            detected_cols = detect_columns(df_cols)
+
+            st.markdown("### 🔧 Confirmez ou ajustez les colonnes")
+            for key in detected_cols:
+                detected_cols[key] = st.selectbox(
+                    f"Colonne pour {key.capitalize()}",
+                    df_cols,
+                    index=df_cols.index(detected_cols[key])
+                )
+
+            try:
+                if streaming:
+                    progress_bar = st.progress(0.0, text="Lecture du fichier...")
+
+                def update_progress(fraction):
+                    progress_bar.progress(fraction, text=f"Lecture du fichier : {fraction:.0%}")
+
+                df_std = load_dataset(
+                    uploaded_file.name, file_bytes, detected_cols, sheet_name, file_key, compact,
+                    update_progress if streaming else None, keep_extra
+                )
+                if streaming:
+                    progress_bar.empty()
+            except MemoryError as e:
+                st.error(f"❌ {e or 'Mémoire insuffisante pour charger ce fichier.'} {LARGE_FILE_HINT}")
+                st.stop()
+            except Exception as e:
+                st.error(f"Erreur lors de la standardisation des colonnes: {e}")
+                st.stop()
+
+            timer.lap("lecture et standardisation", rows=len(df_std))
+            dataset_key = content_hash(file_key, detected_cols, sheet_name, compact, keep_extra)
+            # Fichier déjà en mémoire : le moteur SQL n'apporterait que son surcoût
+            query_backend = "pandas"
+
+        failures = {col: n for col, n in coercion_failures(df_std).items() if n} if df_std is not None else {}
+        if failures:
+            st.warning("⚠️ Valeurs non reconnues (laissées vides) : " +
+                       ", ".join(f"{col} : {n:,}" for col, n in failures.items()))
 
         # ------------------------
         # FILTRES AVANCÉS
         # ------------------------
         st.sidebar.header("🎛️ Filtres avancés")
 
-        min_date, max_date = df_std["Date"].min().date(), df_std["Date"].max().date()
+        # Index construit une fois par jeu de données : tri par date + bitmaps produits/distributeurs ;
+        # avec le moteur SQL, bornes et modalités sont lues par requête
+        if query_backend == "sql":
+            filter_index = get_sql_source(dataset_key, sql_data)
+        else:
+            filter_index = get_filter_index(dataset_key, df_std)
+        st.sidebar.caption(
+            "🦆 Moteur de requêtes : SQL embarqué (DuckDB)" if query_backend == "sql" else "🐼 Moteur de requêtes : pandas"
+        )
+
+        min_date, max_date = filter_index.min_date, filter_index.max_date
         start_date = st.sidebar.date_input("🗓️ Date début", value=min_date, min_value=min_date, max_value=max_date)
         end_date = st.sidebar.date_input("📅 Date fin", value=max_date, min_value=min_date, max_value=max_date)
 
-        produits_dispo = df_std["Produit"].unique().tolist()
+        produits_dispo = filter_index.produits
         selected_produits = st.sidebar.multiselect("🛆 Produits à afficher", produits_dispo, default=produits_dispo)
 
-        distributeurs_dispo = df_std["Distributeur"].unique().tolist()
+        distributeurs_dispo = filter_index.distributeurs
         selected_distributeurs = st.sidebar.multiselect("🏪 Distributeurs à afficher", distributeurs_dispo, default=distributeurs_dispo)
 
         # Recherche intelligente
@@ -170,26 +203,32 @@ if uploaded_file:
             selected_produits = [p for p in produits_dispo if search_term.lower() in p.lower()]
             selected_distributeurs = [d for d in distributeurs_dispo if search_term.lower() in d.lower()]
 
-        df_filtered = df_std[
-            (df_std["Date"].dt.date >= start_date) &
-            (df_std["Date"].dt.date <= end_date) &
-            (df_std["Produit"].isin(selected_produits)) &
-            (df_std["Distributeur"].isin(selected_distributeurs))
-        ]
+        if query_backend == "sql":
+            # Filtres et agrégations exécutés par le moteur SQL : aucune ligne n'est
+            # chargée en pandas, hormis les anomalies et l'export demandé
+            df_filtered = None
+            cube_view = sql_query_view(dataset_key, filter_index, start_date, end_date, selected_produits, selected_distributeurs)
+            n_filtered = len(cube_view)
+        else:
+            df_filtered = filter_index.filter(df_std, start_date, end_date, selected_produits, selected_distributeurs)
+            # KPIs et graphiques agrégés sont lus dans le cube jour × produit × distributeur ;
+            # les lignes filtrées ne servent qu'au boxplot, aux anomalies et à l'export
+            cube_view = query_view(dataset_key, df_std, start_date, end_date, selected_produits, selected_distributeurs)
+            n_filtered = len(df_filtered)
+        timer.lap("filtrage", rows=n_filtered)
 
         # ------------------------
         # KPIs ET COMMENTAIRES
         # ------------------------
         st.markdown("### 📌 Résumé détaillé de l'activité")
-        total_revenu = df_filtered["Revenu"].sum()
-        total_marge = df_filtered["Marge"].sum()
-        revenu_moyen = df_filtered["Revenu"].mean()
-        marge_moyenne = df_filtered["Marge"].mean()
-        nb_contrats = len(df_filtered)
-        date_min = df_filtered["Date"].min().date()
-        date_max = df_filtered["Date"].max().date()
-        nb_jours = (date_max - date_min).days + 1
-        top_produit = df_filtered.groupby("Produit")["Revenu"].sum().idxmax()
+        kpis = summary_kpis(cube_view)
+        total_revenu = kpis["total_revenu"]
+        total_marge = kpis["total_marge"]
+        revenu_moyen = kpis["revenu_moyen"]
+        nb_contrats = kpis["nb_contrats"]
+        date_min, date_max = kpis["date_min"], kpis["date_max"]
+        nb_jours = kpis["nb_jours"]
+        top_produit = kpis["top_produit"]
 
         kpi = st.columns(4)
         kpi[0].metric("💰 Revenu Total", f"{total_revenu:,.2f} TND")
@@ -201,50 +240,59 @@ if uploaded_file:
         kpi2[0].metric("📁 Contrats", nb_contrats)
         kpi2[1].metric("🗓️ Période", f"{date_min} ➔ {date_max}")
         kpi2[2].metric("📆 Jours couverts", nb_jours)
+        timer.lap("kpis", rows=len(cube_view))
 
         # ------------------------
         # GRAPHIQUES INTERACTIFS
         # ------------------------
         st.markdown("### 📆 Évolution du revenu quotidien (interactif)")
-        revenu_par_jour = df_filtered.groupby(df_filtered["Date"].dt.date)["Revenu"].sum()
-        fig1 = px.line(revenu_par_jour, x=revenu_par_jour.index, y=revenu_par_jour.values,
-                       labels={"x": "Date", "y": "Revenu (TND)"}, title="Revenu Quotidien")
+        revenu_par_jour = cube_view.aggregate("Revenu", "Jour")
+        # Série réduite au budget de points ; le zoom recharge la pleine résolution sur la fenêtre choisie
+        if len(revenu_par_jour) > MAX_POINTS:
+            zoom_debut, zoom_fin = st.slider(
+                "🔎 Zoom sur la période", min_value=date_min, max_value=date_max, value=(date_min, date_max)
+            )
+            revenu_par_jour = revenu_par_jour.loc[str(zoom_debut):str(zoom_fin)]
+        fig1 = time_series_figure(revenu_par_jour, "Revenu Quotidien", "Date", "Revenu (TND)")
         st.plotly_chart(fig1, use_container_width=True)
+        timer.lap("graphique revenu quotidien", rows=len(revenu_par_jour))
 
         st.markdown("### 🥇 Top 10 Produits par Revenu (interactif)")
-        top_produits = df_filtered.groupby("Produit")["Revenu"].sum().nlargest(10)
-        fig2 = px.bar(top_produits, x=top_produits.values, y=top_produits.index, orientation='h',
-                      labels={"x": "Revenu (TND)", "y": "Produit"}, color=top_produits.values,
-                      title="Top 10 Produits")
+        revenus_par_produit = cube_view.aggregate("Revenu", "Produit")
+        fig2 = top_products_figure(revenus_par_produit)
         st.plotly_chart(fig2, use_container_width=True)
 
         st.markdown("### 🎯 Répartition des revenus par produit (camembert interactif)")
-        revenus_par_produit = df_filtered.groupby("Produit")["Revenu"].sum()
-        fig3 = px.pie(values=revenus_par_produit.values, names=revenus_par_produit.index,
-                      title="Part de chaque produit dans le revenu")
+        fig3 = product_share_figure(revenus_par_produit)
         st.plotly_chart(fig3, use_container_width=True)
+        timer.lap("graphiques produits", rows=len(revenus_par_produit))
 
         st.markdown("### 🔥 Heatmap Produit / Distributeur (matrice interactive)")
-        pivot = df_filtered.pivot_table(index="Produit", columns="Distributeur", values="Revenu", aggfunc="sum", fill_value=0)
-        fig4 = go.Figure(data=go.Heatmap(
-            z=pivot.values,
-            x=pivot.columns,
-            y=pivot.index,
-            colorscale="YlGnBu"
-        ))
-        fig4.update_layout(title="Heatmap Revenu Produit/Distributeur")
+        # Top N produits/distributeurs, le reste regroupé dans « Autres » : taille de matrice bornée
+        hm_cols = st.columns(3)
+        top_n_produits = hm_cols[0].number_input("Produits affichés", min_value=1, max_value=50, value=20)
+        top_n_distrib = hm_cols[1].number_input("Distributeurs affichés", min_value=1, max_value=50, value=30)
+        detail = hm_cols[2].selectbox("🔍 Détailler le groupe « Autres »", ["Aucun", "Produits", "Distributeurs"])
+        pivot = cube_view.heatmap(
+            "Revenu", int(top_n_produits), int(top_n_distrib),
+            skip_produits=int(top_n_produits) if detail == "Produits" else 0,
+            skip_distributeurs=int(top_n_distrib) if detail == "Distributeurs" else 0,
+        )
+        fig4 = heatmap_figure(pivot)
         st.plotly_chart(fig4, use_container_width=True)
+        timer.lap("heatmap", rows=pivot.size)
 
         st.markdown("### 📅 Revenu mensuel (barres interactives)")
-        df_filtered["Mois"] = df_filtered["Date"].dt.to_period("M").astype(str)
-        revenu_mensuel = df_filtered.groupby("Mois")["Revenu"].sum()
-        fig5 = px.bar(revenu_mensuel, x=revenu_mensuel.index, y=revenu_mensuel.values,
-                      labels={"x": "Mois", "y": "Revenu (TND)"}, title="Revenu Mensuel")
+        revenu_mensuel = cube_view.aggregate("Revenu", "Mois")
+        fig5 = monthly_bar_figure(revenu_mensuel)
         st.plotly_chart(fig5, use_container_width=True)
+        timer.lap("revenu mensuel", rows=len(revenu_mensuel))
 
         st.markdown("### 📦 Dispersion des marges par produit (boxplot)")
-        fig7 = px.box(df_filtered, x="Produit", y="Marge", color="Produit")
+        # Boîtes construites à partir des quartiles par produit et d'un échantillon borné de points aberrants
+        fig7 = margin_box(cube_view, df_filtered)
         st.plotly_chart(fig7, use_container_width=True)
+        timer.lap("boxplot", rows=n_filtered)
 
         # Ajout de fig6 qui n'était pas défini dans le code original, mais inclus dans la liste des exports
         # Il est important de s'assurer que toutes les figures référencées existent.
@@ -252,10 +300,7 @@ if uploaded_file:
         # Ici, fig6 sera défini comme la figure de l'évolution mensuelle qui était précédemment nommée fig5_ax5.
         
         st.markdown("### 📆 Évolution mensuelle du Revenu")
-        df_filtered["Mois"] = df_filtered["Date"].dt.to_period("M").astype(str)
-        revenu_par_mois = df_filtered.groupby("Mois")["Revenu"].sum()
-        fig_evol_mensuelle = px.line(revenu_par_mois, x=revenu_par_mois.index, y=revenu_par_mois.values,
-                                     labels={"x": "Mois", "y": "Revenu (TND)"}, title="Évolution Mensuelle du Revenu")
+        fig_evol_mensuelle = monthly_line_figure(revenu_mensuel)
         st.plotly_chart(fig_evol_mensuelle, use_container_width=True) # Utilisation de Plotly pour l'interactivité
         
         # Définition de fig6 pour l'export, en utilisant la nouvelle figure Plotly
@@ -263,70 +308,163 @@ if uploaded_file:
 
         st.markdown("### 🏅 Top 5 Distributeurs par Revenu")
         # Correction de l'erreur: définition de revenu_par_distrib
-        revenu_par_distrib = df_filtered.groupby("Distributeur")["Revenu"].sum().sort_values(ascending=False)
+        revenu_par_distrib = cube_view.aggregate("Revenu", "Distributeur").sort_values(ascending=False)
         top5_distrib = revenu_par_distrib.head(5)
         st.dataframe(top5_distrib.reset_index().rename(columns={"Distributeur": "Distributeur", "Revenu": "Revenu Total (TND)"}))
+        timer.lap("évolution mensuelle et top distributeurs", rows=len(revenu_par_distrib))
 
         # Prédiction
         st.markdown("### 🔮 Prévision du revenu (3 mois)")
-        forecast = forecast_revenue(df_filtered)
+        forecast = forecast_revenue(revenu_mensuel)
         if forecast is not None:
-            fig8 = go.Figure()
-            fig8.add_trace(go.Bar(x=forecast.index, y=forecast.values, name="Prévision"))
+            fig8 = forecast_figure(forecast)
             st.plotly_chart(fig8, use_container_width=True)
         else:
             st.info("Pas assez de données pour la prévision.")
+        timer.lap("prévision", rows=len(revenu_mensuel))
+
+        st.markdown("### 🧮 Prévisions par segment (3 mois)")
+        segment_dim = st.selectbox("Segmenter par", ["Produit", "Distributeur"])
+        if st.checkbox("Calculer les prévisions par segment"):
+            # Toutes les séries mensuelles en un seul pivot, ajustées en parallèle
+            pivot_segments = cube_view.aggregate("Revenu", ("Mois", segment_dim)).unstack()
+            with st.spinner("Ajustement des modèles..."):
+                segment_forecasts, segment_report = forecast_segments(pivot_segments)
+            st.dataframe(segment_forecasts.rename(columns={"Segment": segment_dim}))
+            st.caption(
+                f"{segment_report['fitted']} modèles ajustés, {segment_report['cached']} en cache, "
+                f"{segment_report['skipped']} séries trop courtes, {segment_report['failed']} échecs — "
+                f"{segment_report['workers']} processus, {segment_report['total_s']:.2f} s"
+            )
+            timer.lap("prévisions par segment", rows=segment_report["series"])
 
         # Détection d'anomalies
-        anomalies = detect_anomalies(df_filtered)
+        # Modèle entraîné une fois par jeu de données ; les lignes filtrées sont seulement évaluées
+        if query_backend == "sql":
+            # Entraînement sur un échantillon tiré par le moteur, évaluation lot par lot
+            anomalies = cached_anomalies(
+                dataset_key, cube_view.memo_key, n_filtered, filter_index.training_sample, cube_view.detect_anomalies
+            )
+        else:
+            anomalies = cached_anomalies(
+                dataset_key, cube_view.memo_key, n_filtered, df_std, lambda detector: detector.detect(df_filtered)
+            )
         if not anomalies.empty:
             st.markdown("### ⚠️ Anomalies détectées")
             st.dataframe(anomalies)
+        timer.lap("anomalies", rows=n_filtered)
+
+        memo = aggregation_stats()
+        st.sidebar.caption(f"🧮 Cache des agrégats : {memo['hits']} réutilisations / {memo['misses']} calculs")
 
         # ------------------------
         # EXPORTS
         # ------------------------
 
-        excel_data = convert_to_excel(df_filtered)
+        # Fichier produit au clic (thread séparé) puis mémorisé par jeu de données et filtres
+        export_fmt = st.radio(
+            "Format d'export des données", list(TABLE_FORMATS),
+            format_func=lambda fmt: TABLE_FORMATS[fmt][0], horizontal=True,
+        )
+        export_label, export_ext, export_mime = TABLE_FORMATS[export_fmt]
         st.download_button(
-            "📥 Télécharger en Excel",
-            data=excel_data,
-            file_name="analyse_ventes.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            f"📥 Télécharger en {export_label}",
+            data=lambda: cached_export(
+                cube_view.memo_key, cube_view.frame() if df_filtered is None else df_filtered, export_fmt
+            )[0],
+            file_name=f"analyse_ventes.{export_ext}",
+            mime=export_mime
         )
+        if (cube_view.memo_key, export_fmt) in table_cache:
+            _, table_report = table_cache.get((cube_view.memo_key, export_fmt))
+            st.caption(
+                f"Dernier export {export_label} : {table_report['rows']:,} lignes"
+                f" ({table_report['sheets']} feuille(s)) en {table_report['seconds']:.2f} s"
+                f" — {table_report['rows_per_s']:,.0f} lignes/s"
+            )
 
-        # Génération d'images pour PDF/PPTX à partir de Plotly
-        buffers = []
-        for fig in [fig1, fig2, fig3, fig4, fig5, fig6, fig7]:
-            buf = io.BytesIO()
-            fig.write_image(buf, format="png")
-            buf.seek(0)
-            buffers.append(buf)
-
-        summary_text = f"""
-        Rapport de Ventes
-        Période : {start_date} à {end_date}
-        Revenu Total : {total_revenu:,.2f} TND
-        Marge Totale : {total_marge:,.2f} TND
-        Nombre de Contrats : {nb_contrats}
-        Top Produit : {top_produit}
-        """
+        # Les images PDF/PPTX ne sont rendues (kaleido) qu'au moment d'un export
+        export_figures = [fig1, fig2, fig3, fig4, fig5, fig6, fig7]
 
-        st.markdown("### 🧾 Générer le rapport PDF ou PowerPoint")
-        colpdf, colpptx = st.columns(2)
-        with colpdf:
-            if st.button("📄 Télécharger le rapport PDF complet"):
-                pdf_file = create_pdf(summary_text, buffers)
-                with open(pdf_file, "rb") as f:
-                    st.download_button("📥 Télécharger le PDF", data=f.read(), file_name="rapport_complet.pdf", mime="application/pdf")
-        with colpptx:
-            if st.button("📊 Télécharger le rapport PowerPoint"):
-                pptx_file = create_pptx(buffers, summary_text)
-                with open(pptx_file, "rb") as f:
-                    st.download_button("📥 Télécharger le PPTX", data=f.read(), file_name="rapport_complet.pptx", mime="application/vnd.openxmlformats-officedocument.presentationml.presentation")
+        summary_text = report_summary(kpis, start_date, end_date)
 
+        st.markdown("### 🧾 Générer le rapport PDF ou PowerPoint")
+        # Les exports tournent dans la file de tâches partagée : le tableau de bord
+        # reste utilisable pendant le rendu et seul le bloc ci-dessous est rafraîchi.
+        session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+        export_jobs = st.session_state.setdefault("export_jobs", {})
+        export_kinds = [
+            ("pdf", "📄 Télécharger le rapport PDF complet", "📥 Télécharger le PDF", "rapport_complet.pdf", "application/pdf"),
+            ("pptx", "📊 Télécharger le rapport PowerPoint", "📥 Télécharger le PPTX", "rapport_complet.pptx", "application/vnd.openxmlformats-officedocument.presentationml.presentation"),
+        ]
+        export_cols = st.columns(2)
+        for col, (kind, label, _, _, _) in zip(export_cols, export_kinds):
+            with col:
+                if st.button(label):
+                    job_key = content_hash(kind, summary_text, *[figure_key(fig) for fig in export_figures])
+                    export_jobs[kind] = report_queue.submit(
+                        session_id, export_report, kind, summary_text, export_figures, key=job_key
+                    ).id
+
+        def active_exports():
+            return any(job is not None and job.active for job in map(report_queue.get, export_jobs.values()))
+
+        polling = active_exports()
+
+        @st.fragment(run_every=1.0 if polling else None)
+        def export_status():
+            for col, (kind, _, download_label, file_name, mime) in zip(st.columns(2), export_kinds):
+                job = report_queue.get(export_jobs.get(kind))
+                if job is None:
+                    continue
+                with col:
+                    if job.state == PENDING:
+                        st.progress(0.0, text=f"⏳ En file d'attente (position {report_queue.position(job) + 1})")
+                    elif job.state == RUNNING:
+                        st.progress(job.progress, text=f"⚙️ {job.message or 'Génération en cours'}")
+                    elif job.state == DONE:
+                        st.download_button(download_label, data=job.result, file_name=file_name, mime=mime)
+                    else:
+                        st.error(f"❌ Échec de l'export {kind.upper()} : {job.error}")
+            # Dernière tâche terminée : un rerun complet arrête le rafraîchissement périodique
+            if polling and not active_exports():
+                st.rerun()
+
+        export_status()
+        timer.lap("exports", rows=n_filtered)
+
+    except MemoryError as e:
+        # Aperçu, index ou graphiques d'un fichier seul trop volumineux
+        st.error(f"❌ Mémoire insuffisante : {e}" + ("" if history_mode else f" {LARGE_FILE_HINT}"))
     except Exception as e:
         st.error(f"❌ Une erreur est survenue : {e}")
         st.exception(e)
+    finally:
+        # Aussi après st.stop() / st.rerun() : tracemalloc ne reste pas actif pour tout le processus
+        timer.finish()
+
+    if instrumented:
+        # Les rapports PDF/PPTX sont rendus (kaleido) hors du rerun : durées des dernières tâches
+        export_timings = []
+        for kind, job_id in st.session_state.get("export_jobs", {}).items():
+            job = report_queue.get(job_id)
+            if job is not None and job.finished_at is not None:
+                export_timings.append({
+                    "export": kind, "état": job.state,
+                    "attente_s": job.started_at - job.submitted_at, "rendu_s": job.finished_at - job.started_at,
+                })
+        with st.sidebar.expander("⏱️ Instrumentation du rerun", expanded=True):
+            st.caption(f"Total : {timer.total_seconds:.2f} s — pic mémoire mesuré par tracemalloc (ralentit l'exécution)")
+            st.dataframe(pd.DataFrame(timer.records).rename(columns={
+                "stage": "Étape", "seconds": "Durée (s)", "rows": "Lignes", "peak_mb": "Pic mémoire (Mo)",
+            }), hide_index=True)
+            if export_timings:
+                st.dataframe(pd.DataFrame(export_timings), hide_index=True)
+        try:
+            timer.write_log(
+                session=st.session_state.get("session_id"), file=source_name, exports=export_timings,
+            )
+        except OSError as e:
+            st.sidebar.warning(f"Journal d'instrumentation non écrit : {e}")
 else:
     st.info("🕐 Veuillez uploader un fichier Excel ou CSV pour commencer.")
@@ -0,0 +1,221 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from anomalies import detect_anomalies, get_detector
+from cache import content_hash
+from exports import TABLE_FORMATS, build_pdf, export_table, render_figures
+from forecasting import forecast_revenue
+from ingestion import file_digest, list_sheets, load_preview
+from pipeline import dashboard_figures, detect_columns, load_dataset, report_summary, summary_kpis
+from queries import get_filter_index, query_view
+
+# Traitement de nuit : même chaîne que app2.py, sans navigateur ni Streamlit.
+# Un dossier de rapports par fichier (KPIs, prévisions, anomalies, PDF, données).
+#   python batch.py exports_distributeurs/ --output rapports/ --workers 4 --formats xlsx parquet
+
+SUPPORTED_EXTENSIONS = (".csv", ".xlsx", ".xls")
+STAGES = ["lecture", "index", "kpis", "graphiques", "prevision", "anomalies", "images", "pdf", "donnees"]
+
+
+def find_inputs(paths):
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(p for p in path.iterdir() if p.suffix.lower() in SUPPORTED_EXTENSIONS))
+        else:
+            files.append(path)
+    return files
+
+
+def output_names(files):
+    # Un dossier de rapports par fichier, distinct même si deux entrées ont le même
+    # nom (ventes.csv et ventes.xlsx, ou ventes.csv dans deux dossiers) : l'extension
+    # est ajoutée en cas d'homonymie, puis un numéro si cela ne suffit pas.
+    # Comparaison sans casse, pour les systèmes de fichiers qui l'ignorent.
+    stems = Counter(Path(path).stem.lower() for path in files)
+    names, used = [], set()
+    for path in map(Path, files):
+        name = path.stem if stems[path.stem.lower()] == 1 else f"{path.stem}_{path.suffix.lstrip('.').lower()}"
+        candidate, n = name, 2
+        while candidate.lower() in used:
+            candidate, n = f"{name}_{n}", n + 1
+        used.add(candidate.lower())
+        names.append(candidate)
+    return names
+
+
+def process_file(path, output_dir, formats=("xlsx",), images=True, name=None):
+    # Exécuté dans un processus du pool ; une étape en échec est notée et les
+    # suivantes continuent tant que les données ont pu être chargées.
+    path = Path(path)
+    out = Path(output_dir) / (name or path.stem)
+    out.mkdir(parents=True, exist_ok=True)
+    result = {"file": str(path), "output": str(out), "rows": 0, "errors": {}, "timings": {}}
+    start = time.perf_counter()
+    last = [start]
+
+    def done(stage):
+        now = time.perf_counter()
+        result["timings"][stage] = now - last[0]
+        last[0] = now
+
+    stage = "lecture"
+    try:
+        data = path.read_bytes()
+        digest = file_digest(data)
+        sheet_name = list_sheets(data, digest)[0] if path.suffix.lower() == ".xlsx" else None
+        preview = load_preview(path.name, data, digest, sheet_name)
+        mapping = detect_columns(preview.columns)
+        df_std = load_dataset(path.name, data, mapping, sheet_name, digest)
+        result["rows"] = len(df_std)
+        done(stage)
+
+        stage = "index"
+        dataset_key = content_hash(digest, mapping, sheet_name, True)
+        filter_index = get_filter_index(dataset_key, df_std)
+        cube_view = query_view(
+            dataset_key, df_std, filter_index.min_date, filter_index.max_date,
+            filter_index.produits, filter_index.distributeurs,
+        )
+        done(stage)
+
+        stage = "kpis"
+        if cube_view.date_range()[0] is None:
+            raise ValueError("aucune ligne datée exploitable")
+        kpis = summary_kpis(cube_view)
+        (out / "kpis.json").write_text(json.dumps(kpis, default=str, ensure_ascii=False, indent=2), encoding="utf-8")
+        done(stage)
+    except Exception as e:
+        result["errors"][stage] = str(e)
+        result["status"] = "échec"
+        result["total_s"] = time.perf_counter() - start
+        return result
+
+    steps = [
+        ("graphiques", lambda: dashboard_figures(cube_view, df_std)),
+        ("prevision", lambda: forecast_revenue(cube_view.aggregate("Revenu", "Mois"))),
+        ("anomalies", lambda: detect_anomalies(df_std, lambda: get_detector(dataset_key, df_std))),
+    ]
+    outputs = {}
+    for stage, step in steps:
+        try:
+            outputs[stage] = step()
+        except Exception as e:
+            result["errors"][stage] = str(e)
+        done(stage)
+    if outputs.get("prevision") is not None:
+        outputs["prevision"].rename("Prévision").to_csv(out / "previsions.csv", index_label="Mois")
+    if outputs.get("anomalies") is not None:
+        outputs["anomalies"].to_csv(out / "anomalies.csv", index=False)
+
+    # Sans graphiques (rendu désactivé ou indisponible), le PDF ne contient que le résumé
+    buffers = []
+    if images and outputs.get("graphiques"):
+        try:
+            buffers = render_figures(outputs["graphiques"])
+        except Exception as e:
+            result["errors"]["images"] = str(e).strip().splitlines()[0]
+    done("images")
+    try:
+        summary = report_summary(kpis, kpis["date_min"], kpis["date_max"])
+        (out / "rapport.pdf").write_bytes(build_pdf(summary, buffers))
+    except Exception as e:
+        result["errors"]["pdf"] = str(e)
+    done("pdf")
+
+    result["exports"] = {}
+    for fmt in formats:
+        try:
+            table, report = export_table(df_std, fmt)
+            (out / f"donnees.{TABLE_FORMATS[fmt][1]}").write_bytes(table)
+            result["exports"][fmt] = report
+        except Exception as e:
+            result["errors"][f"donnees {fmt}"] = str(e)
+    done("donnees")
+
+    result["status"] = "partiel" if result["errors"] else "ok"
+    result["total_s"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(files, output_dir, workers=None, formats=("xlsx",), images=True, on_result=None):
+    # Un fichier par processus ; « spawn » comme pour le pool de prévisions
+    workers = max(1, min(workers or os.cpu_count() or 1, len(files)))
+    names = output_names(files)
+    results = []
+    if workers == 1:
+        for path, name in zip(files, names):
+            results.append(process_file(path, output_dir, formats, images, name))
+            if on_result is not None:
+                on_result(results[-1])
+        return results, workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(process_file, path, output_dir, formats, images, name) for path, name in zip(files, names)
+        ]
+        for future in as_completed(futures):
+            results.append(future.result())
+            if on_result is not None:
+                on_result(results[-1])
+    order = {str(path): i for i, path in enumerate(files)}
+    results.sort(key=lambda r: order[r["file"]])
+    return results, workers
+
+
+def print_summary(results, workers, wall_s):
+    header = f"{'Fichier':<30} {'Lignes':>10} " + " ".join(f"{s[:9]:>9}" for s in STAGES) + f" {'Total':>8}  Statut"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        timings = " ".join(
+            f"{r['timings'][s]:9.2f}" if s in r["timings"] else f"{'-':>9}" for s in STAGES
+        )
+        print(f"{Path(r['file']).name[:30]:<30} {r['rows']:>10,} {timings} {r['total_s']:8.2f}  {r['status']}")
+        for stage, error in r["errors"].items():
+            print(f"    ! {stage} : {error}")
+    cpu_s = sum(r["total_s"] for r in results)
+    rows = sum(r["rows"] for r in results)
+    print(
+        f"{len(results)} fichiers, {rows:,} lignes en {wall_s:.2f} s avec {workers} processus "
+        f"(somme des durées {cpu_s:.2f} s, x{cpu_s / wall_s if wall_s else 0:.1f})"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rapports du tableau de bord en traitement par lots")
+    parser.add_argument("inputs", nargs="+", help="fichiers ou dossiers de fichiers CSV/Excel")
+    parser.add_argument("--output", default="rapports")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--formats", nargs="+", choices=list(TABLE_FORMATS), default=["xlsx"])
+    parser.add_argument("--no-images", action="store_true", help="PDF sans graphiques (pas de rendu kaleido)")
+    args = parser.parse_args(argv)
+
+    files = find_inputs(args.inputs)
+    if not files:
+        parser.error("aucun fichier CSV/Excel trouvé")
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    results, workers = run_batch(
+        files, output_dir, args.workers, tuple(args.formats), not args.no_images,
+        on_result=lambda r: print(f"[{r['status']}] {r['file']} ({r['total_s']:.2f} s)", flush=True),
+    )
+    wall_s = time.perf_counter() - start
+    print()
+    print_summary(results, workers, wall_s)
+
+    summary = {"workers": workers, "wall_s": wall_s, "files": results}
+    (output_dir / "resume.json").write_text(json.dumps(summary, default=str, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 1 if any(r["status"] == "échec" for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+from fpdf import FPDF
+
+from exports import build_pdf, report_cache
+
+# Compare l'ancien rapport PDF (images et document en fichiers temporaires)
+# au rapport construit en mémoire, sur un rapport de 20 graphiques.
+#   python bench_pdf.py --charts 20
+
+SUMMARY_TEXT = (
+    "Rapport de Ventes\n"
+    "Période : 2023-01-01 à 2024-12-31\n"
+    "Revenu Total : 1,518,727.51 TND\n"
+    "Marge Totale : 202,230.74 TND\n"
+    "Nombre de Contrats : 5000\n"
+    "Top Produit : Produit 10"
+)
+
+
+def build_charts(n, seed=0):
+    rng = np.random.default_rng(seed)
+    buffers = []
+    for i in range(n):
+        fig, ax = plt.subplots(figsize=(10, 4))
+        ax.plot(np.cumsum(rng.normal(size=365)))
+        ax.set_title(f"Graphique {i + 1}")
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png")
+        plt.close(fig)
+        buf.seek(0)
+        buffers.append(buf)
+    return buffers
+
+
+def legacy_pdf(summary_text, image_buffers, tmpdir):
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Helvetica", size=12)
+    for line in summary_text.split("\n"):
+        pdf.cell(0, 10, line, new_x="LMARGIN", new_y="NEXT")
+    for img_buf in image_buffers:
+        tmp_img = tempfile.NamedTemporaryFile(delete=False, suffix=".png", dir=tmpdir)
+        tmp_img.write(img_buf.getbuffer())
+        tmp_img.close()
+        pdf.image(tmp_img.name, w=180)
+        pdf.ln(5)
+    tmp_pdf = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=tmpdir)
+    pdf.output(tmp_pdf.name)
+    with open(tmp_pdf.name, "rb") as f:
+        return f.read()
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la génération du rapport PDF")
+    parser.add_argument("--charts", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    buffers = build_charts(args.charts)
+    print(f"Rapport : {args.charts} graphiques, {sum(len(b.getvalue()) for b in buffers) / 1e6:.1f} Mo d'images")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        t_legacy, pdf_legacy = timed(lambda: legacy_pdf(SUMMARY_TEXT, buffers, tmpdir), args.repeat)
+        leftovers = len(os.listdir(tmpdir))
+
+    def cold():
+        report_cache.clear()
+        return build_pdf(SUMMARY_TEXT, buffers)
+
+    t_cold, pdf_memory = timed(cold, args.repeat)
+    t_cached, _ = timed(lambda: build_pdf(SUMMARY_TEXT, buffers), args.repeat)
+
+    print(f"Fichiers temporaires  : {t_legacy:7.3f} s  ({leftovers} fichiers laissés)")
+    print(f"En mémoire            : {t_cold:7.3f} s  (0 fichier)")
+    print(f"En mémoire, en cache  : {t_cached:7.3f} s")
+    print(f"Gain : x{t_legacy / t_cold:.2f} (x{t_legacy / t_cached:.0f} en cache)")
+
+    assert pdf_memory.startswith(b"%PDF")
+    assert abs(len(pdf_memory) - len(pdf_legacy)) < 0.05 * len(pdf_legacy)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from anomalies import AnomalyDetector, detect_anomalies
+from bench_pdf import build_charts
+from exports import build_pdf, build_pptx, export_table, render_figures, report_cache
+from forecasting import forecast_revenue, model_cache
+from ingestion import read_csv_streaming, read_excel_fast, read_file, standardize_columns
+from pipeline import dashboard_figures, report_summary, summary_kpis
+from queries import AggregationCube, FilterIndex
+from synthetic import SOURCE_COLUMNS, contracts_bytes, generate_contracts
+
+# Temps et pic mémoire de chaque étape de app2.py sur un fichier synthétique.
+# Résultats en JSON ; comparés à une référence, toute étape plus lente que
+# la tolérance fait échouer le script (code de sortie 1).
+#   python bench_pipeline.py --rows 200000 --output bench.json
+#   python bench_pipeline.py --rows 200000 --baseline bench.json --tolerance 0.25
+
+
+def measure(fn, repeat):
+    # Meilleur temps sur `repeat` exécutions, puis une exécution sous
+    # tracemalloc pour le pic d'allocation (qui ralentit le code Python)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"seconds": best, "peak_mb": peak / 1e6}
+
+
+def filter_state(filter_index):
+    # Filtre typique : moitié centrale de la période, moitié des produits, tous les distributeurs
+    days = (filter_index.max_date - filter_index.min_date).days
+    start = filter_index.min_date + datetime.timedelta(days=days // 4)
+    end = filter_index.max_date - datetime.timedelta(days=days // 4)
+    return start, end, filter_index.produits[::2], filter_index.distributeurs
+
+
+def run_stages(name, data, repeat):
+    stages = {}
+
+    def stage(label, fn):
+        result, stats = measure(fn, repeat)
+        stages[label] = stats
+        print(f"  {label:<16} {stats['seconds']:8.3f} s  {stats['peak_mb']:8.1f} Mo", flush=True)
+        return result
+
+    raw = stage("lecture", lambda: read_file(name, data))
+    # partial lie la frame brute : le `del` ci-dessous la libère sans toucher à une fermeture
+    df = stage("standardisation", partial(standardize_columns, raw, SOURCE_COLUMNS, compact=True))
+    del raw
+    if name.endswith(".csv"):
+        stage("lecture_flux", lambda: read_csv_streaming(data, SOURCE_COLUMNS))
+    else:
+        stage("lecture_flux", lambda: read_excel_fast(data, SOURCE_COLUMNS))
+
+    filter_index = stage("index", lambda: FilterIndex(df))
+    start, end, produits, distributeurs = filter_state(filter_index)
+    df_filtered = stage("filtrage", lambda: filter_index.filter(df, start, end, produits, distributeurs))
+    cube = stage("cube", lambda: AggregationCube(df))
+
+    def aggregations():
+        view = cube.select(start, end, produits, distributeurs)
+        view.totals()
+        for by in ("Jour", "Mois", "Produit", "Distributeur"):
+            view.aggregate("Revenu", by)
+        view.heatmap("Revenu")
+        return view
+
+    view = stage("agregations", aggregations)
+    monthly = view.aggregate("Revenu", "Mois")
+
+    def forecast():
+        model_cache.clear()
+        return forecast_revenue(monthly)
+
+    stage("prevision", forecast)
+    stage("anomalies", lambda: detect_anomalies(df_filtered, AnomalyDetector().fit(df)))
+    figures = stage("graphiques", lambda: dashboard_figures(view, df_filtered))
+    stage("excel", lambda: export_table(df_filtered, "xlsx"))
+
+    try:
+        images = render_figures(figures)
+    except Exception:
+        # Sans Chrome, kaleido ne rend rien : images de même ordre de taille via matplotlib
+        images = build_charts(len(figures))
+    summary = report_summary(summary_kpis(view), start, end)
+
+    def uncached(build):
+        def run():
+            report_cache.clear()
+            return build(summary, images)
+        return run
+
+    stage("pdf", uncached(build_pdf))
+    stage("pptx", uncached(build_pptx))
+    return stages, len(df), len(df_filtered)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(stages, baseline, tolerance, min_seconds):
+    # Régression : plus lent que la référence au-delà de la tolérance, en
+    # ignorant les étapes trop courtes pour être mesurées de façon fiable
+    regressions = []
+    print(f"\n{'Étape':<16} {'Référence':>10} {'Actuel':>10} {'Écart':>8}")
+    for label, stats in stages.items():
+        ref = baseline["stages"].get(label)
+        if ref is None:
+            print(f"{label:<16} {'-':>10} {stats['seconds']:10.3f}")
+            continue
+        ratio = stats["seconds"] / ref["seconds"] - 1 if ref["seconds"] else 0.0
+        slow = ratio > tolerance and stats["seconds"] - ref["seconds"] > min_seconds
+        print(f"{label:<16} {ref['seconds']:10.3f} {stats['seconds']:10.3f} {ratio:+8.0%}{'  RÉGRESSION' if slow else ''}")
+        if slow:
+            regressions.append(label)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des étapes du tableau de bord")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--distributors", type=int, default=500)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--dirty", type=float, default=0.01)
+    parser.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="fichier JSON des résultats")
+    parser.add_argument("--baseline", help="résultats de référence (JSON) à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="ralentissement toléré (0.25 = +25 %%)")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="écart absolu minimal pour une régression")
+    args = parser.parse_args()
+
+    params = {
+        "rows": args.rows, "products": args.products, "distributors": args.distributors,
+        "days": args.days, "dirty": args.dirty, "format": args.format, "seed": args.seed, "repeat": args.repeat,
+    }
+    df = generate_contracts(args.rows, args.products, args.distributors, days=args.days,
+                            dirty_ratio=args.dirty, seed=args.seed)
+    data = contracts_bytes(df, args.format)
+    del df
+    print(f"Fichier {args.format} : {args.rows:,} lignes, {len(data) / 1e6:.1f} Mo")
+
+    stages, rows, filtered_rows = run_stages(f"contrats.{args.format}", data, args.repeat)
+    results = {
+        "meta": {
+            "params": params,
+            "rows": rows,
+            "filtered_rows": filtered_rows,
+            "commit": git_commit(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+        },
+        "stages": stages,
+        "total_seconds": sum(s["seconds"] for s in stages.values()),
+    }
+    print(f"Total : {results['total_seconds']:.2f} s")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"]["params"] != params:
+            print("Attention : paramètres différents de la référence", file=sys.stderr)
+        regressions = compare(stages, baseline, args.tolerance, args.min_seconds)
+        if regressions:
+            print(f"Régressions : {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import ast
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# Temps d'import au démarrage d'une application : seules les instructions
+# d'import de premier niveau du script sont rejouées (sans lancer Streamlit),
+# dans un interpréteur neuf, sous `python -X importtime`.
+#   python bench_startup.py app2.py --output startup.json
+#   python bench_startup.py app2.py --max-ms 1500      # échoue au-delà du budget
+
+# Modules qui ne doivent être chargés qu'à l'usage de leur fonctionnalité
+HEAVY_MODULES = [
+    "sklearn", "statsmodels", "pptx", "fpdf", "seaborn", "matplotlib",
+    "plotly", "kaleido", "xlsxwriter", "openpyxl", "pyarrow",
+]
+
+
+def startup_imports(script, local=None):
+    # local=True : modules du projet seulement ; False : dépendances externes seulement
+    source = Path(script).read_text(encoding="utf-8")
+    folder = Path(script).resolve().parent
+    statements = []
+    for node in ast.parse(source).body:
+        if not isinstance(node, (ast.Import, ast.ImportFrom)):
+            continue
+        names = [alias.name for alias in node.names] if isinstance(node, ast.Import) else [node.module or ""]
+        is_local = any((folder / f"{name.split('.')[0]}.py").exists() for name in names)
+        if local is None or local == is_local:
+            statements.append(ast.get_source_segment(source, node))
+    return statements
+
+
+def parse_importtime(stderr):
+    # Lignes « import time: self [us] | cumulative | package », indentées selon la profondeur
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append({
+            "module": name.strip(), "depth": depth,
+            "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return entries
+
+
+def loaded_modules(statements, cwd):
+    code = "\n".join(statements + [
+        "import json, sys",
+        "print(json.dumps(sorted({m.split('.')[0] for m in sys.modules})))",
+    ])
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=cwd, check=True)
+    return set(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+
+def measure_startup(script, cwd=None):
+    cwd = cwd or Path(script).resolve().parent
+    code = "\n".join(startup_imports(script) + [
+        "import json, sys",
+        "print(json.dumps(sorted({m.split('.')[0] for m in sys.modules})))",
+    ])
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=cwd,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    entries = parse_importtime(proc.stderr)
+    top_level = [e for e in entries if e["depth"] == 0]
+    loaded = set(json.loads(proc.stdout.strip().splitlines()[-1]))
+    # Modules lourds déjà tirés par les dépendances externes (streamlit, pandas...) :
+    # signalés, mais hors de portée du projet
+    external = loaded_modules(startup_imports(script, local=False), cwd)
+    return {
+        "total_ms": sum(e["cumulative_ms"] for e in top_level),
+        "top_level": sorted(top_level, key=lambda e: -e["cumulative_ms"]),
+        "heavy_loaded": [m for m in HEAVY_MODULES if m in loaded and m not in external],
+        "heavy_external": [m for m in HEAVY_MODULES if m in external],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rapport des temps d'import au démarrage")
+    parser.add_argument("script", nargs="?", default="app2.py")
+    parser.add_argument("--repeat", type=int, default=3, help="mesures, la plus rapide est gardée")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="fichier JSON du rapport")
+    parser.add_argument("--max-ms", type=float, help="budget de démarrage ; échec au-delà")
+    parser.add_argument("--allow-heavy", action="store_true", help="ne pas échouer si un module lourd est chargé")
+    args = parser.parse_args()
+
+    report = min((measure_startup(args.script) for _ in range(args.repeat)), key=lambda r: r["total_ms"])
+    print(f"Démarrage de {args.script} : {report['total_ms']:.0f} ms d'imports")
+    print(f"{'Module':<40} {'Cumulé (ms)':>12} {'Propre (ms)':>12}")
+    for e in report["top_level"][:args.top]:
+        print(f"{e['module']:<40} {e['cumulative_ms']:12.1f} {e['self_ms']:12.1f}")
+    heavy = report["heavy_loaded"]
+    print(f"Modules lourds chargés au démarrage : {', '.join(heavy) if heavy else 'aucun'}")
+    if report["heavy_external"]:
+        print(f"  (déjà chargés par les dépendances externes : {', '.join(report['heavy_external'])})")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"script": args.script, **report}, f, ensure_ascii=False, indent=2)
+
+    failed = False
+    if heavy and not args.allow_heavy:
+        print(f"Échec : {', '.join(heavy)} importé(s) au démarrage", file=sys.stderr)
+        failed = True
+    if args.max_ms is not None and report["total_ms"] > args.max_ms:
+        print(f"Échec : {report['total_ms']:.0f} ms > budget de {args.max_ms:.0f} ms", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
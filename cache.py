@@ -0,0 +1,117 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def content_hash(*parts):
+    # Empreinte stable de contenus hétérogènes (octets, textes, DataFrames...)
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            h.update(part)
+        elif isinstance(part, (pd.DataFrame, pd.Series, pd.Index)):
+            h.update(pd.util.hash_pandas_object(part, index=True).values.tobytes())
+            h.update(repr(getattr(part, "columns", part.name)).encode())
+        elif isinstance(part, dict):
+            h.update(repr(sorted(part.items())).encode())
+        else:
+            h.update(repr(part).encode())
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def sizeof(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value.values())
+    # Tableaux numpy et objets exposant leur propre estimation (index, cube, vues...)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    # Cache LRU borné par un budget mémoire (octets) et/ou un nombre d'entrées.
+    # Partagé entre les reruns et les sessions : un verrou protège l'état.
+
+    def __init__(self, budget_bytes=None, max_entries=None, sizeof=sizeof):
+        self.budget_bytes = budget_bytes
+        self.max_entries = max_entries
+        self.sizeof = sizeof
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self.used_bytes -= self._entries.pop(key)[1]
+            # Une entrée plus grosse que tout le budget n'est pas conservée
+            if self.budget_bytes is not None and size > self.budget_bytes:
+                return value
+            self._entries[key] = (value, size)
+            self.used_bytes += size
+            while self._entries and (
+                (self.budget_bytes is not None and self.used_bytes > self.budget_bytes)
+                or (self.max_entries is not None and len(self._entries) > self.max_entries)
+            ):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.used_bytes -= evicted
+        return value
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute())
+        return value
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.used_bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "used_bytes": self.used_bytes,
+            "budget_bytes": self.budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+
+# plotly n'est importé qu'à la construction des figures : le sous-échantillonnage
+# reste utilisable (et rapide à importer) sans lui
+
+# ------------------------
+# SÉRIES TEMPORELLES
+# ------------------------
+
+# Budget de points envoyés au navigateur par série (~ largeur utile du graphique en pixels)
+MAX_POINTS = 1500
+# Au-delà, la trace est rendue en WebGL
+WEBGL_THRESHOLD = 1000
+
+
+def lttb_indices(x, y, n_out):
+    # Largest-Triangle-Three-Buckets : garde, dans chaque seau, le point qui forme
+    # le plus grand triangle avec le point retenu précédent et la moyenne du seau suivant.
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def downsample_series(series, max_points=MAX_POINTS):
+    if len(series) <= max_points:
+        return series
+    index = series.index
+    if isinstance(index, pd.DatetimeIndex):
+        x = index.asi8.astype("float64")
+    else:
+        x = np.arange(len(series), dtype="float64")
+    y = series.to_numpy(dtype="float64")
+    y = np.where(np.isnan(y), 0.0, y)
+    return series.iloc[lttb_indices(x, y, max_points)]
+
+
+def time_series_figure(series, title, x_label, y_label, max_points=MAX_POINTS):
+    # Série réduite à `max_points` en conservant sa forme ; WebGL pour les longues séries
+    import plotly.graph_objects as go
+
+    sampled = downsample_series(series, max_points)
+    trace = go.Scattergl if len(sampled) > WEBGL_THRESHOLD else go.Scatter
+    fig = go.Figure(trace(x=sampled.index, y=sampled.values, mode="lines", name=y_label))
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title=y_label)
+    if len(sampled) < len(series):
+        fig.add_annotation(
+            text=f"{len(sampled):,} points affichés sur {len(series):,}",
+            xref="paper", yref="paper", x=1, y=1.08, showarrow=False, font={"size": 10},
+        )
+    return fig
+
+
+# ------------------------
+# BOXPLOT PAR STATISTIQUES
+# ------------------------
+
+# Nombre maximal de points aberrants affichés, tous groupes confondus
+BOX_MAX_OUTLIERS = 1000
+BOX_COLORS = [
+    "#636EFA", "#EF553B", "#00CC96", "#AB63FA", "#FFA15A",
+    "#19D3F3", "#FF6692", "#B6E880", "#FF97FF", "#FECB52",
+]
+
+
+def box_summary(df, by, value, max_outliers=BOX_MAX_OUTLIERS):
+    # Quartiles, moustaches (1,5 × IQR, ramenées aux données) et échantillon
+    # borné de points aberrants, calculés par des agrégations groupées.
+    data = df[[by, value]].dropna(subset=[value])
+    if data.empty:
+        return pd.DataFrame(columns=["q1", "median", "q3", "lowerfence", "upperfence", "count"]), data
+    values = data[value].astype("float64")
+    groups = data[by]
+    grouped = values.groupby(groups, observed=True)
+    stats = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ["q1", "median", "q3"]
+    stats["count"] = grouped.size()
+    iqr = stats["q3"] - stats["q1"]
+    low_limit = (stats["q1"] - 1.5 * iqr).reindex(groups).to_numpy()
+    high_limit = (stats["q3"] + 1.5 * iqr).reindex(groups).to_numpy()
+
+    inside = (values.to_numpy() >= low_limit) & (values.to_numpy() <= high_limit)
+    fences = values[inside].groupby(groups[inside], observed=True).agg(["min", "max"])
+    stats["lowerfence"] = fences["min"]
+    stats["upperfence"] = fences["max"]
+
+    outliers = data[~inside]
+    per_group = max(1, max_outliers // max(len(stats), 1))
+    outliers = outliers.sample(frac=1, random_state=0).groupby(by, observed=True).head(per_group)
+    return stats, outliers
+
+
+def box_figure(stats, outliers, by, value, title=None):
+    # Une boîte par groupe à partir des statistiques : la taille de la figure
+    # ne dépend que du nombre de groupes, pas du nombre de lignes.
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    for i, (name, row) in enumerate(stats.iterrows()):
+        color = BOX_COLORS[i % len(BOX_COLORS)]
+        label = str(name)
+        fig.add_trace(go.Box(
+            name=label, x=[label], q1=[row["q1"]], median=[row["median"]], q3=[row["q3"]],
+            lowerfence=[row["lowerfence"]], upperfence=[row["upperfence"]],
+            boxpoints=False, marker_color=color, legendgroup=label,
+        ))
+        points = outliers.loc[outliers[by] == name, value]
+        if len(points):
+            fig.add_trace(go.Scatter(
+                x=[label] * len(points), y=points.to_numpy(), mode="markers", marker_color=color,
+                name=label, legendgroup=label, showlegend=False,
+            ))
+    fig.update_layout(title=title, xaxis_title=by, yaxis_title=value)
+    return fig
+
+
+# ------------------------
+# GRAPHIQUES DU TABLEAU DE BORD
+# ------------------------
+
+# Construits à partir des agrégats du cube, partagés par app2.py et le traitement par lots
+
+
+def top_products_figure(revenus_par_produit, n=10):
+    import plotly.express as px
+
+    top_produits = revenus_par_produit.nlargest(n)
+    return px.bar(top_produits, x=top_produits.values, y=top_produits.index, orientation='h',
+                  labels={"x": "Revenu (TND)", "y": "Produit"}, color=top_produits.values,
+                  title=f"Top {n} Produits")
+
+
+def product_share_figure(revenus_par_produit):
+    import plotly.express as px
+
+    return px.pie(values=revenus_par_produit.values, names=revenus_par_produit.index,
+                  title="Part de chaque produit dans le revenu")
+
+
+def heatmap_figure(pivot):
+    import plotly.graph_objects as go
+
+    fig = go.Figure(data=go.Heatmap(
+        z=pivot.values,
+        x=pivot.columns,
+        y=pivot.index,
+        colorscale="YlGnBu"
+    ))
+    fig.update_layout(title="Heatmap Revenu Produit/Distributeur")
+    return fig
+
+
+def _month_labels(series):
+    series = series.copy()
+    series.index = series.index.strftime("%Y-%m")
+    return series
+
+
+def monthly_bar_figure(revenu_mensuel):
+    import plotly.express as px
+
+    revenu_mensuel = _month_labels(revenu_mensuel)
+    return px.bar(revenu_mensuel, x=revenu_mensuel.index, y=revenu_mensuel.values,
+                  labels={"x": "Mois", "y": "Revenu (TND)"}, title="Revenu Mensuel")
+
+
+def monthly_line_figure(revenu_mensuel):
+    import plotly.express as px
+
+    revenu_mensuel = _month_labels(revenu_mensuel)
+    return px.line(revenu_mensuel, x=revenu_mensuel.index, y=revenu_mensuel.values,
+                   labels={"x": "Mois", "y": "Revenu (TND)"}, title="Évolution Mensuelle du Revenu")
+
+
+def forecast_figure(forecast):
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=forecast.index, y=forecast.values, name="Prévision"))
+    return fig
@@ -0,0 +1,309 @@
+import asyncio
+import datetime
+import gzip
+import io
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from cache import LRUCache, content_hash
+
+# ------------------------
+# IMAGES DES GRAPHIQUES
+# ------------------------
+
+# PNG déjà rendus, indexés par le contenu de la figure : réexporter la même vue est gratuit
+png_cache = LRUCache(budget_bytes=128 * 1024 * 1024)
+# Onglets Chrome rendant en parallèle dans un même navigateur
+RENDER_WORKERS = 4
+
+
+# plotly.io (kaleido), fpdf, python-pptx et xlsxwriter ne sont importés qu'au
+# premier export qui en a besoin
+def _to_image(fig, format="png", scale=1):
+    import plotly.io as pio
+
+    return pio.to_image(fig, format=format, scale=scale)
+
+
+def figure_key(fig, fmt="png", scale=1):
+    return content_hash(fig.to_json(), fmt, scale)
+
+
+def figure_png(fig, scale=1):
+    return png_cache.get_or_compute(figure_key(fig, "png", scale), lambda: _to_image(fig, "png", scale))
+
+
+async def _render_batch(figs, fmt, scale, tabs, on_done):
+    # Un seul navigateur kaleido pour tout le lot (pio.to_image en lance un par
+    # figure) ; les figures se répartissent entre ses onglets
+    import kaleido
+
+    async with kaleido.Kaleido(n=tabs) as k:
+
+        async def render(i, fig):
+            png = await k.calc_fig(fig, opts={"format": fmt, "scale": scale})
+            on_done(i, png)
+
+        await asyncio.gather(*(render(i, fig) for i, fig in enumerate(figs)))
+
+
+def render_figures(figs, scale=1, max_workers=RENDER_WORKERS, progress=None):
+    # Rendu kaleido à la demande (uniquement lors d'un export), en un lot pour
+    # les figures absentes du cache ; renvoie des tampons prêts à relire.
+    keys = [figure_key(fig, "png", scale) for fig in figs]
+    pngs = {key: png_cache.get(key) for key in keys}
+    missing = [(key, fig) for key, fig in zip(keys, figs) if pngs[key] is None]
+    done = len(figs) - len(missing)
+    if progress is not None:
+        progress(done / max(len(figs), 1), f"Graphiques : {done}/{len(figs)}")
+    if missing:
+
+        def on_done(i, png):
+            nonlocal done
+            pngs[missing[i][0]] = png_cache.put(missing[i][0], png)
+            done += 1
+            if progress is not None:
+                progress(done / len(figs), f"Graphiques : {done}/{len(figs)}")
+
+        tabs = max(1, min(max_workers, len(missing)))
+        asyncio.run(_render_batch([fig for _, fig in missing], "png", scale, tabs, on_done))
+    return [io.BytesIO(pngs[key]) for key in keys]
+
+
+# ------------------------
+# RAPPORTS PDF / POWERPOINT
+# ------------------------
+
+# Rapports générés, indexés par le texte du résumé et l'empreinte des images
+report_cache = LRUCache(budget_bytes=256 * 1024 * 1024)
+
+
+def _image_bytes(buf):
+    return buf.getvalue() if isinstance(buf, io.BytesIO) else bytes(buf)
+
+
+def report_key(kind, summary_text, images, **options):
+    return content_hash(kind, summary_text, options, *[content_hash(png) for png in images])
+
+
+def _render_pdf(summary_text, images, gap):
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Helvetica", size=12)
+    for line in summary_text.split("\n"):
+        pdf.cell(0, 10, line, new_x="LMARGIN", new_y="NEXT")
+    for png in images:
+        pdf.image(io.BytesIO(png), w=180)
+        pdf.ln(gap)
+    return bytes(pdf.output())
+
+
+def build_pdf(summary_text, image_buffers, gap=5):
+    # PDF construit entièrement en mémoire : images lues depuis les tampons,
+    # document renvoyé en octets, aucun fichier temporaire.
+    images = [_image_bytes(buf) for buf in image_buffers]
+    key = report_key("pdf", summary_text, images, gap=gap)
+    return report_cache.get_or_compute(key, lambda: _render_pdf(summary_text, images, gap))
+
+
+def _render_pptx(summary_text, images):
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    prs = Presentation()
+    slide_layout = prs.slide_layouts[5]
+    slide = prs.slides.add_slide(slide_layout)
+    slide.shapes.title.text = "Rapport de Ventes"
+    tf = slide.shapes.add_textbox(Inches(0.5), Inches(1.5), Inches(9), Inches(1)).text_frame
+    for line in summary_text.split("\n"):
+        tf.add_paragraph().text = line
+    for png in images:
+        slide = prs.slides.add_slide(slide_layout)
+        slide.shapes.add_picture(io.BytesIO(png), Inches(1), Inches(1), width=Inches(8))
+    out = io.BytesIO()
+    prs.save(out)
+    return out.getvalue()
+
+
+def build_pptx(summary_text, image_buffers):
+    images = [_image_bytes(buf) for buf in image_buffers]
+    key = report_key("pptx", summary_text, images)
+    return report_cache.get_or_compute(key, lambda: _render_pptx(summary_text, images))
+
+
+REPORT_BUILDERS = {"pdf": build_pdf, "pptx": build_pptx}
+
+
+def export_report(kind, summary_text, figs, progress=None):
+    # Tâche d'export complète (rendu des graphiques puis assemblage), exécutée
+    # hors du thread Streamlit ; `progress(fraction, message)` suit l'avancement.
+    def step(fraction, message):
+        if progress is not None:
+            progress(0.9 * fraction, message)
+
+    buffers = render_figures(figs, progress=step)
+    step(1.0, f"Assemblage du {kind.upper()}")
+    return REPORT_BUILDERS[kind](summary_text, buffers)
+
+
+# ------------------------
+# EXPORT DES DONNÉES
+# ------------------------
+
+# Limite d'une feuille Excel, en-tête compris
+EXCEL_MAX_ROWS = 1_048_576
+EXCEL_DATE_FORMAT = "dd/mm/yyyy"
+# Lignes converties à la fois en valeurs Python avant écriture
+EXCEL_BLOCK_ROWS = 10_000
+TABLE_FORMATS = {
+    "xlsx": ("Excel", "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv.gz": ("CSV compressé", "csv.gz", "application/gzip"),
+    "parquet": ("Parquet", "parquet", "application/vnd.apache.parquet"),
+}
+
+# Exports déjà produits : (octets, rapport de débit), indexés par l'appelant
+table_cache = LRUCache(budget_bytes=512 * 1024 * 1024, sizeof=lambda entry: len(entry[0]))
+
+
+def _excel_kind(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return "date"
+    if pd.api.types.is_bool_dtype(values):
+        return "bool"
+    if pd.api.types.is_numeric_dtype(values):
+        return "number"
+    if pd.api.types.is_object_dtype(values):
+        # Types mélangés (dates, nombres, textes) : type choisi cellule par cellule
+        return "mixed"
+    return "text"
+
+
+def _excel_number(v):
+    # Excel n'a pas d'infini : écrit en texte, comme DataFrame.to_excel (inf_rep)
+    if math.isnan(v):
+        return None
+    return v if math.isfinite(v) else ("inf" if v > 0 else "-inf")
+
+
+def _excel_column(values, kind):
+    # Bloc de colonne converti en liste Python, valeurs manquantes en None ;
+    # renvoie (type d'écriture, valeurs)
+    if kind == "date":
+        return kind, [None if pd.isna(v) else v for v in values.dt.to_pydatetime()]
+    if kind == "number":
+        if values.dtype == "float32":
+            # Plus courte écriture décimale du float32 : 126.8 et non 126.80000305175781
+            numbers = values.to_numpy(dtype="float32").astype(str).astype("float64")
+        else:
+            numbers = values.to_numpy(dtype="float64", na_value=np.nan)
+        if np.isinf(numbers).any():
+            # Infinis écrits en texte : écriture générique pour ce bloc
+            return "mixed", [_excel_number(v) for v in numbers.tolist()]
+        return kind, [None if math.isnan(v) else v for v in numbers.tolist()]
+    if kind == "bool":
+        return kind, [None if pd.isna(v) else bool(v) for v in values.astype(object)]
+    if kind == "mixed":
+        return kind, [
+            None if v is None or v is pd.NaT or v is pd.NA
+            else _excel_number(v) if isinstance(v, float)
+            else v
+            for v in values
+        ]
+    return kind, [None if pd.isna(v) else str(v) for v in values.astype(object)]
+
+
+def write_excel(
+    df, sheet_name="Analyse", rows_per_sheet=EXCEL_MAX_ROWS - 1, constant_memory=True, block_rows=EXCEL_BLOCK_ROWS
+):
+    # Écriture ligne à ligne en mode constant_memory (xlsxwriter ne garde
+    # qu'une ligne en mémoire, textes en chaînes inline) ; les colonnes sont
+    # converties par blocs de block_rows lignes, jamais en entier. Au-delà de la
+    # limite d'Excel, les lignes continuent sur « Analyse 2 », « Analyse 3 »...
+    import xlsxwriter
+
+    buf = io.BytesIO()
+    n_sheets = max(1, math.ceil(len(df) / rows_per_sheet))
+    workbook = xlsxwriter.Workbook(buf, {"constant_memory": constant_memory, "use_zip64": True})
+    date_format = workbook.add_format({"num_format": EXCEL_DATE_FORMAT})
+    header = [str(c) for c in df.columns]
+    kinds = [_excel_kind(df[c]) for c in df.columns]
+    for sheet in range(n_sheets):
+        first = sheet * rows_per_sheet
+        last = min(first + rows_per_sheet, len(df))
+        worksheet = workbook.add_worksheet(sheet_name if n_sheets == 1 else f"{sheet_name} {sheet + 1}")
+        worksheet.write_row(0, 0, header)
+
+        def write_any(r, c, v):
+            if isinstance(v, datetime.date):
+                return worksheet.write_datetime(r, c, v, date_format)
+            return worksheet.write(r, c, v)
+
+        # Méthode d'écriture typée par colonne : évite la détection de type cellule par cellule
+        writers = {
+            "date": lambda r, c, v: worksheet.write_datetime(r, c, v, date_format),
+            "number": worksheet.write_number,
+            "bool": worksheet.write_boolean,
+            "text": worksheet.write_string,
+            "mixed": write_any,
+        }
+        for start in range(first, last, block_rows):
+            block = df.iloc[start:min(start + block_rows, last)]
+            writes, columns = [], []
+            for col, kind in enumerate(kinds):
+                kind, values = _excel_column(block.iloc[:, col], kind)
+                writes.append((col, writers[kind]))
+                columns.append(values)
+            for row, values_row in enumerate(zip(*columns), start=start - first + 1):
+                for (col, write), value in zip(writes, values_row):
+                    if value is not None:
+                        write(row, col, value)
+    workbook.close()
+    return buf.getvalue(), n_sheets
+
+
+def write_csv_gz(df):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=6, mtime=0) as gz:
+        df.to_csv(io.TextIOWrapper(gz, encoding="utf-8", newline=""), index=False)
+    return buf.getvalue()
+
+
+def write_parquet(df):
+    buf = io.BytesIO()
+    df.to_parquet(buf, index=False, compression="zstd")
+    return buf.getvalue()
+
+
+def export_table(df, fmt="xlsx", sheet_name="Analyse"):
+    # Renvoie (octets, rapport) ; le rapport mesure le débit de l'export.
+    start = time.perf_counter()
+    sheets = 1
+    if fmt == "xlsx":
+        data, sheets = write_excel(df, sheet_name)
+    elif fmt == "csv.gz":
+        data = write_csv_gz(df)
+    elif fmt == "parquet":
+        data = write_parquet(df)
+    else:
+        raise ValueError(f"Format d'export inconnu : {fmt}")
+    seconds = time.perf_counter() - start
+    report = {
+        "format": fmt,
+        "rows": len(df),
+        "sheets": sheets,
+        "bytes": len(data),
+        "seconds": seconds,
+        "rows_per_s": len(df) / seconds if seconds > 0 else float("inf"),
+    }
+    return data, report
+
+
+def cached_export(key, df, fmt="xlsx"):
+    # Export mémorisé par une clé fournie par l'appelant (jeu de données et
+    # filtres) : évite de hacher tout le DataFrame à chaque rerun.
+    return table_cache.get_or_compute((key, fmt), lambda: export_table(df, fmt))
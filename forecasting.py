@@ -0,0 +1,137 @@
+import os
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from cache import LRUCache, content_hash, sizeof
+
+
+def results_nbytes(results):
+    # Un modèle ajusté garde la série, les valeurs ajustées et les composantes :
+    # quelques tableaux de la longueur de la série
+    attributes = list(vars(results).values()) + list(vars(results.model).values())
+    return sum(sizeof(a) for a in attributes if isinstance(a, (np.ndarray, pd.Series, pd.DataFrame, pd.Index)))
+
+
+# Modèles ajustés, partagés par toutes les sessions du serveur : une série
+# mensuelle inchangée (même contenu, mêmes réglages) n'est jamais réajustée.
+model_cache = LRUCache(budget_bytes=32 * 1024 * 1024, max_entries=128, sizeof=results_nbytes)
+
+FORECAST_HORIZON = 3
+# Nombre minimal de mois (strictement supérieur) pour ajuster un modèle
+MIN_MONTHS = 6
+
+
+def fit_model(ts, trend="add", seasonal=None):
+    # statsmodels n'est chargé qu'à la première prévision
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    key = content_hash(ts, trend, seasonal)
+    return model_cache.get_or_compute(key, lambda: ExponentialSmoothing(ts, trend=trend, seasonal=seasonal).fit())
+
+
+def forecast_revenue(ts, horizon=FORECAST_HORIZON, trend="add", seasonal=None):
+    # ts : revenu mensuel indexé par le premier jour du mois
+    if len(ts) > MIN_MONTHS:
+        return fit_model(ts, trend, seasonal).forecast(horizon)
+    return None
+
+
+# ------------------------
+# PRÉVISIONS PAR SEGMENT
+# ------------------------
+
+# Prévisions par segment déjà calculées (série + réglages + horizon)
+segment_cache = LRUCache(budget_bytes=32 * 1024 * 1024, max_entries=4096)
+# En dessous de ce nombre de séries à ajuster, le pool coûte plus qu'il ne rapporte
+POOL_MIN_SERIES = 8
+
+POOL_WORKERS = os.cpu_count() or 1
+
+_pool = None
+
+
+def _get_pool():
+    # Pool persistant créé à la demande ; « spawn » évite de forker le
+    # processus Streamlit et ses threads
+    global _pool
+    if _pool is None:
+        import atexit
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+    return _pool
+
+
+def _fit_forecast(job):
+    # Exécuté dans un processus du pool : (nom, série, réglages) -> (nom, prévision ou erreur)
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    name, ts, horizon, trend, seasonal = job
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        try:
+            fit = ExponentialSmoothing(ts, trend=trend, seasonal=seasonal).fit()
+            return name, fit.forecast(horizon), None
+        except Exception as e:
+            return name, None, str(e)
+
+
+def monthly_pivot(df, by, value="Revenu"):
+    # Toutes les séries mensuelles en un seul pivot : mois × segment (NaN = mois sans vente)
+    months = df["Date"].dt.to_period("M").dt.to_timestamp()
+    return df.pivot_table(index=months, columns=by, values=value, aggfunc="sum", observed=True)
+
+
+def forecast_segments(pivot, horizon=FORECAST_HORIZON, trend="add", seasonal=None, parallel=True):
+    # Renvoie (table longue Segment / Mois / Prévision, rapport de temps)
+    start = time.perf_counter()
+    report = {"series": pivot.shape[1], "fitted": 0, "cached": 0, "skipped": 0, "failed": 0, "workers": 1}
+    results = {}
+    jobs = []
+    last_month = pivot.index.max()
+    for name in pivot.columns:
+        # Même règle que forecast_revenue : plus de MIN_MONTHS mois avec des ventes
+        observed = pivot[name].dropna()
+        if len(observed) <= MIN_MONTHS:
+            report["skipped"] += 1
+            continue
+        # Holt-Winters attend une série mensuelle régulière : les mois sans vente
+        # entre la première vente et le dernier mois du pivot valent 0
+        months = pd.date_range(observed.index.min(), last_month, freq="MS")
+        ts = observed.reindex(months, fill_value=0.0).rename(None)
+        key = content_hash(ts, trend, seasonal, horizon)
+        cached = segment_cache.get(key)
+        if cached is not None:
+            results[name] = cached
+            report["cached"] += 1
+        else:
+            jobs.append((key, (name, ts, horizon, trend, seasonal)))
+    report["prepare_s"] = time.perf_counter() - start
+
+    fit_start = time.perf_counter()
+    if parallel and POOL_WORKERS > 1 and len(jobs) >= POOL_MIN_SERIES:
+        report["workers"] = POOL_WORKERS
+        chunksize = max(1, len(jobs) // (POOL_WORKERS * 4))
+        outputs = _get_pool().map(_fit_forecast, [job for _, job in jobs], chunksize=chunksize)
+    else:
+        outputs = map(_fit_forecast, [job for _, job in jobs])
+    for (key, _), (name, forecast, error) in zip(jobs, outputs):
+        if error is not None:
+            report["failed"] += 1
+            continue
+        results[name] = segment_cache.put(key, forecast)
+        report["fitted"] += 1
+    report["fit_s"] = time.perf_counter() - fit_start
+
+    frames = [
+        pd.DataFrame({"Segment": str(name), "Mois": forecast.index, "Prévision": forecast.to_numpy()})
+        for name, forecast in results.items()
+    ]
+    table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["Segment", "Mois", "Prévision"])
+    report["total_s"] = time.perf_counter() - start
+    return table, report
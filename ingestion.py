@@ -0,0 +1,373 @@
+import io
+import os
+
+import pandas as pd
+
+from cache import LRUCache, content_hash
+from parsing import parse_amounts, parse_dates
+
+# ------------------------
+# CACHE D'INGESTION
+# ------------------------
+
+# Budget mémoire partagé par les fichiers bruts et les DataFrames standardisés.
+# Au-delà, les entrées les moins récemment utilisées sont évincées.
+INGESTION_CACHE_BUDGET = int(os.environ.get("INGESTION_CACHE_MB", "1024")) * 1024 * 1024
+
+ingestion_cache = LRUCache(budget_bytes=INGESTION_CACHE_BUDGET)
+
+
+def file_digest(data):
+    return content_hash(data)
+
+
+def read_upload(uploaded_file, session_state):
+    # Contenu d'un fichier déposé et son empreinte, clé des lectures mises en cache :
+    # un rerun ne relance pas le parseur. L'empreinte est mémorisée dans la session
+    # par file_id, le fichier n'est donc haché qu'une fois par dépôt.
+    data = uploaded_file.getvalue()
+    digests = session_state.setdefault("upload_digests", {})
+    if uploaded_file.file_id not in digests:
+        digests[uploaded_file.file_id] = file_digest(data)
+    return data, digests[uploaded_file.file_id]
+
+
+def read_file(name, data, sheet_name=None):
+    buf = io.BytesIO(data)
+    if name.endswith(".csv"):
+        return pd.read_csv(buf)
+    return pd.read_excel(buf, sheet_name=sheet_name or 0)
+
+
+# Colonnes produites par la standardisation, dans l'ordre
+CANONICAL_COLUMNS = ["Date", "Revenu", "Marge", "Produit", "Assureur", "Distributeur"]
+DIMENSION_COLUMNS = ["Produit", "Distributeur"]
+MEASURE_COLUMNS = ["Revenu", "Marge", "Assureur"]
+# Les montants compacts sont en float32 : les totaux doivent être sommés en float64
+MEASURE_DTYPE = "float32"
+
+
+def coerce_columns(df, columns_mapping):
+    # Renvoie les colonnes canoniques et, par colonne, le nombre de valeurs
+    # non vides qui n'ont pas pu être converties
+    columns = {}
+    failures = {}
+    columns["Date"], failures["Date"] = parse_dates(df[columns_mapping['date']], dayfirst=True)
+    columns["Revenu"], failures["Revenu"] = parse_amounts(df[columns_mapping['revenu']])
+    columns["Marge"], failures["Marge"] = parse_amounts(df[columns_mapping['marge']])
+    columns["Produit"] = df[columns_mapping['produit']].astype(str)
+    columns["Assureur"], failures["Assureur"] = parse_amounts(df[columns_mapping['assureur']])
+    columns["Distributeur"] = df[columns_mapping['distributeur']].astype(str)
+    return columns, failures
+
+
+def extra_columns(df_cols, columns_mapping):
+    # Colonnes du fichier hors mapping, gardées telles quelles à la suite des
+    # colonnes canoniques (un homonyme d'une colonne canonique est remplacé par elle)
+    used = set(columns_mapping.values()) | set(CANONICAL_COLUMNS)
+    return [col for col in df_cols if col not in used]
+
+
+def compact_frame(columns, extras=None):
+    # Colonnes canoniques : dimensions en catégories, mesures en float32 ;
+    # colonnes supplémentaires en catégories de textes
+    df = pd.DataFrame(dict(columns), columns=CANONICAL_COLUMNS)
+    for col in DIMENSION_COLUMNS:
+        df[col] = df[col].astype("category")
+    for col in MEASURE_COLUMNS:
+        df[col] = df[col].astype(MEASURE_DTYPE)
+    if extras is not None:
+        for col in extras.columns:
+            values = extras[col]
+            text = values[values.notna()].astype(str)
+            # Catégories toujours textuelles, même pour un bloc vide : les blocs restent fusionnables
+            df[col] = pd.Categorical(
+                values.where(values.isna(), values.astype(str)), categories=pd.Index(text.unique()).astype(str)
+            )
+    return df
+
+
+def standardize_columns(df, columns_mapping, compact=False, keep_extra=True):
+    # keep_extra=False (mode compact seulement) : seules les colonnes canoniques sont gardées
+    columns, failures = coerce_columns(df, columns_mapping)
+    if compact:
+        extras = df[extra_columns(df.columns, columns_mapping)] if keep_extra else None
+        df_std = compact_frame(columns, extras)
+    else:
+        df_std = df.copy()
+        for col, values in columns.items():
+            df_std[col] = values
+    df_std.attrs["coercion_failures"] = failures
+    return df_std
+
+
+def coercion_failures(df):
+    return df.attrs.get("coercion_failures", {})
+
+
+def load_raw(name, data, digest=None, sheet_name=None):
+    # Le parseur ne tourne qu'une fois par contenu de fichier : les reruns
+    # Streamlit (filtres, widgets) retrouvent le DataFrame dans le cache.
+    digest = digest or file_digest(data)
+    key = ("raw", digest, os.path.splitext(name)[1].lower(), sheet_name)
+    return ingestion_cache.get_or_compute(key, lambda: read_file(name, data, sheet_name))
+
+
+def load_standardized(name, data, columns_mapping, digest=None, sheet_name=None, compact=False, keep_extra=True):
+    digest = digest or file_digest(data)
+    key = ("std", digest, tuple(sorted(columns_mapping.items())), sheet_name, compact, keep_extra)
+    if not compact:
+        return ingestion_cache.get_or_compute(
+            key, lambda: standardize_columns(load_raw(name, data, digest, sheet_name), columns_mapping)
+        )
+
+    def compute():
+        # Le fichier brut n'est pas conservé : seule la frame compacte reste en cache
+        ingestion_cache.discard(("raw", digest, os.path.splitext(name)[1].lower(), sheet_name))
+        raw = read_file(name, data, sheet_name)
+        df_std = standardize_columns(raw, columns_mapping, compact=True, keep_extra=keep_extra)
+        del raw
+        return df_std
+
+    return ingestion_cache.get_or_compute(key, compute)
+
+
+# ------------------------
+# LECTURE CSV EN FLUX
+# ------------------------
+
+CSV_CHUNK_ROWS = 200_000
+# Marge de sécurité : concaténation des blocs + frames intermédiaires
+MEMORY_SAFETY_FACTOR = 2.5
+
+
+def _open_binary(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "rb")
+    source.seek(0)
+    return source
+
+
+def _source_size(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    pos = source.tell()
+    size = source.seek(0, io.SEEK_END)
+    source.seek(pos)
+    return size
+
+
+def available_memory():
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def read_csv_preview(source, nrows=1000):
+    # Quelques lignes suffisent pour l'aperçu et la détection des colonnes
+    return pd.read_csv(_open_binary(source), nrows=nrows)
+
+
+def _csv_read_options(fh, columns_mapping, keep_extra=True):
+    # Sans les colonnes supplémentaires, seules les colonnes mappées sont lues.
+    # Les dimensions, la date et les colonnes supplémentaires sont lues en texte
+    # pour que tous les blocs aient le même type.
+    text_cols = {columns_mapping[k] for k in ("date", "produit", "distributeur")}
+    if not keep_extra:
+        return {"usecols": sorted(set(columns_mapping.values())), "dtype": {col: str for col in text_cols}}
+    header = list(pd.read_csv(fh, nrows=0).columns)
+    fh.seek(0)
+    text_cols |= set(extra_columns(header, columns_mapping))
+    return {"dtype": {col: str for col in text_cols}}
+
+
+def coerce_chunk(chunk, columns_mapping, keep_extra=True):
+    return standardize_columns(chunk, columns_mapping, compact=True, keep_extra=keep_extra)
+
+
+def concat_chunks(chunks):
+    if not chunks:
+        return pd.DataFrame(columns=CANONICAL_COLUMNS)
+    # union_categoricals évite le repli en object quand les catégories diffèrent entre blocs
+    categorical = [col for col in chunks[0].columns if isinstance(chunks[0][col].dtype, pd.CategoricalDtype)]
+    dims = {
+        col: pd.api.types.union_categoricals([c[col] for c in chunks], ignore_order=True)
+        for col in categorical
+    }
+    columns = list(chunks[0].columns)
+    df = pd.concat([c.drop(columns=categorical) for c in chunks], ignore_index=True)
+    for col in categorical:
+        df[col] = pd.Categorical(dims[col])
+    df = df[columns]
+    failures = {}
+    for chunk in chunks:
+        for col, n in coercion_failures(chunk).items():
+            failures[col] = failures.get(col, 0) + n
+    df.attrs["coercion_failures"] = failures
+    return df
+
+
+def estimate_csv_memory(source, columns_mapping, sample_rows=5000, keep_extra=True):
+    # Extrapole l'empreinte mémoire du résultat à partir d'un échantillon :
+    # octets de fichier par ligne et octets en mémoire par ligne coercée.
+    size = _source_size(source)
+    fh = _open_binary(source)
+    try:
+        sample = pd.read_csv(fh, nrows=sample_rows, **_csv_read_options(fh, columns_mapping, keep_extra))
+        fh.seek(0)
+        head = fh.read(1024 * 1024)
+    finally:
+        if isinstance(source, (str, os.PathLike)):
+            fh.close()
+    if sample.empty:
+        return 0
+    lines = max(head.count(b"\n"), 1)
+    est_rows = size / (len(head) / lines)
+    per_row = coerce_chunk(sample, columns_mapping, keep_extra).memory_usage(deep=True).sum() / len(sample)
+    return int(est_rows * per_row * MEMORY_SAFETY_FACTOR)
+
+
+def check_memory(source, columns_mapping, keep_extra=True):
+    needed = estimate_csv_memory(source, columns_mapping, keep_extra=keep_extra)
+    available = available_memory()
+    if available is not None and needed > available:
+        raise MemoryError(
+            f"Mémoire insuffisante : environ {needed / 1e6:,.0f} Mo nécessaires, "
+            f"{available / 1e6:,.0f} Mo disponibles"
+        )
+    return needed
+
+
+def read_csv_streaming(source, columns_mapping, chunk_rows=CSV_CHUNK_ROWS, progress=None, keep_extra=True):
+    # Lecture par blocs des seules colonnes mappées ; chaque bloc est coercé
+    # en frame compacte avant de lire le suivant.
+    size = _source_size(source) or 1
+    fh = _open_binary(source)
+    chunks = []
+    try:
+        reader = pd.read_csv(fh, chunksize=chunk_rows, **_csv_read_options(fh, columns_mapping, keep_extra))
+        for chunk in reader:
+            chunks.append(coerce_chunk(chunk, columns_mapping, keep_extra))
+            if progress is not None:
+                progress(min(fh.tell() / size, 1.0))
+    finally:
+        if isinstance(source, (str, os.PathLike)):
+            fh.close()
+    return concat_chunks(chunks)
+
+
+def load_csv_streaming(data, columns_mapping, digest=None, progress=None, keep_extra=True):
+    digest = digest or file_digest(data)
+    key = ("stream", digest, tuple(sorted(columns_mapping.items())), keep_extra)
+
+    def compute():
+        # Vérification mémoire avant de lancer la lecture complète
+        check_memory(data, columns_mapping, keep_extra)
+        return read_csv_streaming(data, columns_mapping, progress=progress, keep_extra=keep_extra)
+
+    return ingestion_cache.get_or_compute(key, compute)
+
+
+# ------------------------
+# LECTURE EXCEL RAPIDE
+# ------------------------
+
+EXCEL_CHUNK_ROWS = 50_000
+
+
+def _open_workbook(source):
+    from openpyxl import load_workbook
+
+    # read_only : lignes lues à la volée sans modèle objet complet ;
+    # data_only : valeurs calculées, pas de formules ni de styles
+    return load_workbook(_open_binary(source), read_only=True, data_only=True)
+
+
+def list_sheets(data, digest=None):
+    digest = digest or file_digest(data)
+
+    def compute():
+        wb = _open_workbook(data)
+        try:
+            return list(wb.sheetnames)
+        finally:
+            wb.close()
+
+    return ingestion_cache.get_or_compute(("sheets", digest), compute)
+
+
+def read_excel_preview(source, sheet_name=None, nrows=1000):
+    wb = _open_workbook(source)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+        rows = ws.iter_rows(max_row=nrows + 1, values_only=True)
+        header = [str(h) for h in next(rows, ())]
+        return pd.DataFrame(list(rows), columns=header)
+    finally:
+        wb.close()
+
+
+def read_excel_fast(source, columns_mapping, sheet_name=None, chunk_rows=EXCEL_CHUNK_ROWS, progress=None,
+                    keep_extra=True):
+    # Parcourt la feuille en lecture seule en ne gardant que les cellules des
+    # colonnes mappées (et des colonnes supplémentaires si keep_extra) ; les
+    # lignes sont coercées par blocs comme pour le CSV.
+    wb = _open_workbook(source)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+        header = [str(h) for h in next(ws.iter_rows(max_row=1, values_only=True), ())]
+        usecols = sorted(set(columns_mapping.values()))
+        if keep_extra:
+            usecols += [col for col in extra_columns(header, columns_mapping) if col not in usecols]
+        missing = [col for col in usecols if col not in header]
+        if missing:
+            raise KeyError(f"Colonnes absentes de la feuille : {missing}")
+        positions = [header.index(col) for col in usecols]
+        first, last = min(positions), max(positions)
+        offsets = [pos - first for pos in positions]
+        total = ws.max_row or 0
+
+        chunks = []
+        buffer = []
+        n = 0
+        for row in ws.iter_rows(min_row=2, min_col=first + 1, max_col=last + 1, values_only=True):
+            buffer.append([row[i] if i < len(row) else None for i in offsets])
+            n += 1
+            if len(buffer) >= chunk_rows:
+                chunks.append(coerce_chunk(pd.DataFrame(buffer, columns=usecols), columns_mapping, keep_extra))
+                buffer = []
+                if progress is not None and total:
+                    progress(min(n / total, 1.0))
+        if buffer:
+            chunks.append(coerce_chunk(pd.DataFrame(buffer, columns=usecols), columns_mapping, keep_extra))
+    finally:
+        wb.close()
+    if progress is not None:
+        progress(1.0)
+    return concat_chunks(chunks)
+
+
+def load_excel_fast(data, columns_mapping, sheet_name=None, digest=None, progress=None, keep_extra=True):
+    digest = digest or file_digest(data)
+    key = ("xlsx", digest, tuple(sorted(columns_mapping.items())), sheet_name, keep_extra)
+    return ingestion_cache.get_or_compute(
+        key, lambda: read_excel_fast(data, columns_mapping, sheet_name, progress=progress, keep_extra=keep_extra)
+    )
+
+
+def load_preview(name, data, digest=None, sheet_name=None):
+    # Aperçu des premières lignes pour les modes en flux (colonnes + st.dataframe)
+    digest = digest or file_digest(data)
+    key = ("preview", digest, sheet_name)
+    if name.endswith(".csv"):
+        return ingestion_cache.get_or_compute(key, lambda: read_csv_preview(data))
+    if name.endswith(".xlsx"):
+        return ingestion_cache.get_or_compute(key, lambda: read_excel_preview(data, sheet_name))
+    return ingestion_cache.get_or_compute(
+        key, lambda: pd.read_excel(io.BytesIO(data), sheet_name=sheet_name or 0, nrows=1000)
+    )
@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# ------------------------
+# MESURE DES ÉTAPES
+# ------------------------
+
+# Journal local des reruns instrumentés, une ligne JSON par rerun
+INSTRUMENTATION_LOG = os.environ.get("INSTRUMENTATION_LOG", "instrumentation.jsonl")
+
+# tracemalloc est global au processus : il reste actif tant qu'une mesure est en cours
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+def _start_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+class StageTimer:
+    # Chronomètre par tours : chaque appel à `lap` clôt l'étape en cours (temps
+    # écoulé depuis le tour précédent, lignes traitées, pic d'allocation).
+    # Désactivé, il ne mesure rien : le script peut l'appeler sans condition.
+    # Le pic mémoire vient de tracemalloc (allocations Python et NumPy) ; il
+    # ralentit l'exécution et se mélange entre sessions simultanées. tracemalloc
+    # n'est lancé qu'au début de la première étape (`start`, ou `with timer:`)
+    # et `finish` doit toujours suivre, y compris après st.stop() / st.rerun().
+
+    def __init__(self, enabled=True, track_memory=True):
+        self.enabled = enabled
+        self.track_memory = enabled and track_memory
+        self.records = []
+        self.started_at = time.time()
+        self._tracing = False
+        self._finished = False
+        self._last = time.perf_counter()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.finish()
+        return False
+
+    def start(self):
+        if self.track_memory and not self._tracing and not self._finished:
+            _start_tracing()
+            tracemalloc.reset_peak()
+            self._tracing = True
+        self._last = time.perf_counter()
+
+    def lap(self, stage, rows=None):
+        if not self.enabled or self._finished:
+            return None
+        now = time.perf_counter()
+        record = {"stage": stage, "seconds": now - self._last, "rows": None if rows is None else int(rows)}
+        if self._tracing:
+            record["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.reset_peak()
+        self.records.append(record)
+        # Le temps passé à mesurer n'est compté dans aucune étape
+        self._last = time.perf_counter()
+        return record
+
+    @property
+    def total_seconds(self):
+        return sum(r["seconds"] for r in self.records)
+
+    def finish(self):
+        if self._tracing:
+            _stop_tracing()
+            self._tracing = False
+        self._finished = True
+        return self.records
+
+    def write_log(self, path=INSTRUMENTATION_LOG, **meta):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "total_s": self.total_seconds,
+            **meta,
+            "stages": self.records,
+        }
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        return entry
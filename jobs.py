@@ -0,0 +1,154 @@
+import itertools
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+
+# ------------------------
+# FILE DE TÂCHES EN ARRIÈRE-PLAN
+# ------------------------
+
+REPORT_WORKERS = 2
+# Tâches terminées conservées (résultats téléchargeables) avant d'être oubliées
+MAX_FINISHED_JOBS = 64
+
+PENDING = "en attente"
+RUNNING = "en cours"
+DONE = "terminé"
+FAILED = "échec"
+
+
+class Job:
+    # Une exécution de `fn(*args, progress=...)` soumise par un propriétaire (session)
+
+    def __init__(self, job_id, owner, key, fn, args):
+        self.id = job_id
+        self.owner = owner
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.state = PENDING
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def active(self):
+        return self.state in (PENDING, RUNNING)
+
+    def report(self, fraction, message=""):
+        self.progress = min(max(float(fraction), 0.0), 1.0)
+        self.message = message
+
+
+class JobQueue:
+    # Pool borné de threads alimenté par une file par propriétaire : les
+    # travailleurs servent les propriétaires à tour de rôle, si bien qu'une
+    # session qui soumet beaucoup d'exports ne retarde pas les autres.
+
+    def __init__(self, workers=REPORT_WORKERS, max_finished=MAX_FINISHED_JOBS):
+        self.workers = workers
+        self.max_finished = max_finished
+        self._queues = OrderedDict()
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def _ensure_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"report-worker-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, owner, fn, *args, key=None):
+        # Une tâche identique (même clé) encore active ou terminée est réutilisée
+        with self._cond:
+            if key is not None:
+                for job in reversed(self._jobs.values()):
+                    if job.owner == owner and job.key == key and job.state != FAILED:
+                        return job
+            job = Job(next(self._ids), owner, key, fn, args)
+            self._jobs[job.id] = job
+            self._queues.setdefault(owner, deque()).append(job)
+            self._forget_finished()
+            self._ensure_workers()
+            self._cond.notify()
+            return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def position(self, job):
+        # Rang de la tâche dans l'ordre de service à tour de rôle (0 = prochaine)
+        with self._cond:
+            if job.state != PENDING:
+                return 0
+            queues = [list(q) for q in self._queues.values()]
+            rank = 0
+            for depth in itertools.count():
+                for q in queues:
+                    if depth < len(q):
+                        if q[depth] is job:
+                            return rank
+                        rank += 1
+                if all(depth >= len(q) for q in queues):
+                    return rank
+
+    def stats(self):
+        with self._cond:
+            states = [job.state for job in self._jobs.values()]
+            return {
+                "workers": self.workers,
+                "pending": states.count(PENDING),
+                "running": states.count(RUNNING),
+                "done": states.count(DONE),
+                "failed": states.count(FAILED),
+            }
+
+    def _next_job(self):
+        # Premier propriétaire en attente, puis renvoyé en fin de rotation
+        for owner, queue in self._queues.items():
+            job = queue.popleft()
+            if queue:
+                self._queues.move_to_end(owner)
+            else:
+                del self._queues[owner]
+            return job
+        return None
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                job.state = RUNNING
+                job.started_at = time.time()
+            try:
+                job.result = job.fn(*job.args, progress=job.report)
+                job.report(1.0, job.message)
+                job.state = DONE
+            except Exception as e:
+                job.error = str(e).strip() or type(e).__name__
+                job.traceback = traceback.format_exc()
+                job.state = FAILED
+            finally:
+                job.finished_at = time.time()
+                job.fn = job.args = None
+
+
+# File partagée par toutes les sessions du serveur
+report_queue = JobQueue()
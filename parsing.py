@@ -0,0 +1,165 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# ------------------------
+# DATES
+# ------------------------
+
+# Formats essayés sur un échantillon, jour en premier d'abord (exports tunisiens/français)
+DATE_FORMATS = [
+    "%d/%m/%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%d/%m/%y",
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y/%m/%d",
+    "%Y%m%d",
+    "%m/%d/%Y",
+]
+DATE_SAMPLE_SIZE = 200
+
+# Numéros de série Excel (jours depuis le 30/12/1899) acceptés : ~1927 à ~2173
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+EXCEL_SERIAL_MIN = 10_000
+EXCEL_SERIAL_MAX = 100_000
+
+
+def infer_date_format(strings, sample_size=DATE_SAMPLE_SIZE):
+    # Retient le format qui reconnaît le plus de valeurs de l'échantillon
+    sample = pd.Series(strings[:sample_size], dtype=object)
+    if sample.empty:
+        return None
+    best, best_ok = None, 0
+    for fmt in DATE_FORMATS:
+        ok = pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum()
+        if ok > best_ok:
+            best, best_ok = fmt, ok
+            if ok == len(sample):
+                break
+    return best
+
+
+def excel_serial_to_datetime(values):
+    values = np.asarray(values, dtype="float64")
+    valid = (values >= EXCEL_SERIAL_MIN) & (values <= EXCEL_SERIAL_MAX)
+    out = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[ns]")
+    days = pd.to_timedelta(values[valid], unit="D")
+    out[valid] = (EXCEL_EPOCH + days).values
+    return out
+
+
+def _parse_date_uniques(uniques, dayfirst):
+    # uniques : tableau object sans doublon (datetimes, nombres, textes mélangés)
+    out = np.full(len(uniques), np.datetime64("NaT"), dtype="datetime64[ns]")
+    is_dt = np.fromiter(
+        (isinstance(v, (datetime.date, np.datetime64)) for v in uniques), dtype=bool, count=len(uniques)
+    )
+    if is_dt.any():
+        out[is_dt] = pd.to_datetime(pd.Series(uniques[is_dt]), errors="coerce", utc=False).values
+
+    rest = np.flatnonzero(~is_dt)
+    if len(rest):
+        numbers = pd.to_numeric(pd.Series(uniques[rest], dtype=object), errors="coerce").to_numpy(dtype="float64")
+        is_serial = (numbers >= EXCEL_SERIAL_MIN) & (numbers <= EXCEL_SERIAL_MAX)
+        out[rest[is_serial]] = excel_serial_to_datetime(numbers[is_serial])
+
+        text_idx = rest[~is_serial]
+        strings = pd.Series(uniques[text_idx], dtype=object).astype(str).str.strip()
+        fmt = infer_date_format(strings[strings != ""].to_numpy())
+        if fmt is not None:
+            parsed = pd.to_datetime(strings, format=fmt, errors="coerce")
+        else:
+            parsed = pd.Series(pd.NaT, index=strings.index, dtype="datetime64[ns]")
+        # Valeurs hors format dominant : ISO 8601 d'abord (jamais lu jour en premier),
+        # puis analyse au cas par cas sur les seules valeurs encore manquantes
+        missing = parsed.isna() & (strings != "")
+        if missing.any():
+            parsed[missing] = pd.to_datetime(strings[missing], errors="coerce", format="ISO8601")
+            missing = parsed.isna() & (strings != "")
+        if missing.any():
+            parsed[missing] = pd.to_datetime(strings[missing], dayfirst=dayfirst, errors="coerce", format="mixed")
+        out[text_idx] = parsed.to_numpy(dtype="datetime64[ns]")
+    return out
+
+
+def parse_dates(values, dayfirst=True):
+    # Renvoie (dates, nombre de valeurs non vides converties en NaT).
+    # Chaque valeur distincte n'est analysée qu'une fois puis redistribuée.
+    s = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s, 0
+    if pd.api.types.is_numeric_dtype(s):
+        parsed = pd.Series(excel_serial_to_datetime(s.to_numpy(dtype="float64")), index=s.index)
+        return parsed, int((parsed.isna() & s.notna()).sum())
+
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    uniques = np.asarray(uniques, dtype=object)
+    parsed_uniques = _parse_date_uniques(uniques, dayfirst)
+
+    out = np.full(len(codes), np.datetime64("NaT"), dtype="datetime64[ns]")
+    present = codes >= 0
+    out[present] = parsed_uniques[codes[present]]
+
+    blank = np.fromiter((isinstance(v, str) and not v.strip() for v in uniques), dtype=bool, count=len(uniques))
+    failed = np.isnat(parsed_uniques) & ~blank
+    counts = np.bincount(codes[present], minlength=len(uniques))
+    return pd.Series(out, index=s.index), int(counts[failed].sum())
+
+
+# ------------------------
+# MONTANTS
+# ------------------------
+
+# Espaces (dont insécables), apostrophes de milliers, devises et pourcentages
+AMOUNT_NOISE = "[\\s\u00a0\u202f'’]|(?i:tnd|dinars?|dt|eur|€|%)"
+
+
+def _clean_amount_strings(strings):
+    s = strings.str.replace(AMOUNT_NOISE, "", regex=True)
+    # Négatifs comptables : (123,45) -> -123,45
+    s = s.str.replace(r"^\((.*)\)$", r"-\1", regex=True)
+
+    n_comma = s.str.count(",")
+    n_dot = s.str.count(r"\.")
+    last_comma = s.str.rfind(",")
+    last_dot = s.str.rfind(".")
+    # Virgule décimale : une seule virgule, placée après le dernier point éventuel
+    comma_decimal = (n_comma == 1) & (last_comma > last_dot)
+    # Plusieurs points sans virgule décimale : points de milliers (1.234.567)
+    dot_thousands = comma_decimal | (n_dot > 1)
+
+    s = s.where(~dot_thousands, s.str.replace(".", "", regex=False))
+    s = s.where(~comma_decimal, s.str.replace(",", ".", regex=False))
+    # Reste des virgules : séparateurs de milliers (1,234,567.89)
+    return s.str.replace(",", "", regex=False)
+
+
+def parse_amounts(values):
+    # Renvoie (montants float64, nombre de valeurs non vides non reconnues).
+    # Le nettoyage se fait en opérations de chaînes vectorisées sur les valeurs distinctes.
+    s = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.astype("float64"), 0
+
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    uniques = pd.Series(np.asarray(uniques, dtype=object))
+    direct = pd.to_numeric(uniques, errors="coerce")
+    text = uniques[direct.isna()].astype(str)
+    parsed = direct.copy()
+    if len(text):
+        parsed[text.index] = pd.to_numeric(_clean_amount_strings(text), errors="coerce")
+    parsed = parsed.to_numpy(dtype="float64")
+
+    out = np.full(len(codes), np.nan)
+    present = codes >= 0
+    out[present] = parsed[codes[present]]
+
+    blank = uniques.astype(str).str.strip().eq("").to_numpy()
+    failed = np.isnan(parsed) & ~blank
+    counts = np.bincount(codes[present], minlength=len(uniques))
+    return pd.Series(out, index=s.index), int(counts[failed].sum())
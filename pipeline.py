@@ -0,0 +1,120 @@
+from charts import (
+    box_figure,
+    box_summary,
+    heatmap_figure,
+    monthly_bar_figure,
+    monthly_line_figure,
+    product_share_figure,
+    time_series_figure,
+    top_products_figure,
+)
+from ingestion import load_csv_streaming, load_excel_fast, load_standardized
+
+# Étapes du tableau de bord sans dépendance à Streamlit : app2.py les appelle
+# entre ses widgets, batch.py les enchaîne pour le traitement de nuit.
+
+# ------------------------
+# COLONNES
+# ------------------------
+
+COLUMN_SYNONYMS = {
+    "date": ["date", "date début", "date de vente"],
+    "revenu": ["prime total ttc", "revenu", "ca"],
+    "marge": ["marge", "marge distributeur ttc"],
+    "produit": ["produit", "device", "type", "categorie"],
+    "assureur": ["part assureur", "part", "taux"],
+    "distributeur": ["distributeur", "revendeur", "client", "point de vente"],
+}
+
+
+def detect_column(possible_names, df_cols):
+    for name in possible_names:
+        for col in df_cols:
+            if name.lower().strip() == col.lower().strip():
+                return col
+    return None
+
+
+def detect_columns(df_cols, synonyms=COLUMN_SYNONYMS):
+    # Colonne reconnue pour chaque champ, la première colonne à défaut
+    df_cols = list(df_cols)
+    return {key: detect_column(names, df_cols) or df_cols[0] for key, names in synonyms.items()}
+
+
+# ------------------------
+# CHARGEMENT
+# ------------------------
+
+
+def load_dataset(name, data, columns_mapping, sheet_name=None, digest=None, compact=True, progress=None,
+                 keep_extra=True):
+    # Mode compact : lecture en flux des CSV et .xlsx ; sinon lecture complète standardisée.
+    # keep_extra=False (mode compact) écarte les colonnes non mappées.
+    if compact and name.endswith(".csv"):
+        return load_csv_streaming(data, columns_mapping, digest, progress=progress, keep_extra=keep_extra)
+    if compact and name.endswith(".xlsx"):
+        return load_excel_fast(data, columns_mapping, sheet_name, digest, progress=progress, keep_extra=keep_extra)
+    return load_standardized(name, data, columns_mapping, digest, sheet_name, compact, keep_extra)
+
+
+# ------------------------
+# RÉSUMÉ
+# ------------------------
+
+
+def summary_kpis(cube_view):
+    totals = cube_view.totals()
+    date_min, date_max = cube_view.date_range()
+    return {
+        "total_revenu": totals["Revenu_sum"],
+        "total_marge": totals["Marge_sum"],
+        "revenu_moyen": totals["Revenu_mean"],
+        "marge_moyenne": totals["Marge_mean"],
+        "nb_contrats": totals["n"],
+        "date_min": date_min,
+        "date_max": date_max,
+        "nb_jours": (date_max - date_min).days + 1,
+        "top_produit": cube_view.aggregate("Revenu", "Produit").idxmax(),
+    }
+
+
+def report_summary(kpis, start_date, end_date):
+    return f"""
+        Rapport de Ventes
+        Période : {start_date} à {end_date}
+        Revenu Total : {kpis['total_revenu']:,.2f} TND
+        Marge Totale : {kpis['total_marge']:,.2f} TND
+        Nombre de Contrats : {kpis['nb_contrats']}
+        Top Produit : {kpis['top_produit']}
+        """
+
+
+# ------------------------
+# GRAPHIQUES
+# ------------------------
+
+
+def margin_box(cube_view, df_filtered):
+    # Sans lignes filtrées (moteur SQL), la vue calcule elle-même quartiles et points aberrants
+    if df_filtered is None:
+        box_stats, box_outliers = cube_view.box_summary("Produit", "Marge")
+    else:
+        box_stats, box_outliers = cube_view.memoize(
+            ("box", "Produit", "Marge"), lambda: box_summary(df_filtered, "Produit", "Marge")
+        )
+    return box_figure(box_stats, box_outliers, "Produit", "Marge")
+
+
+def dashboard_figures(cube_view, df_filtered, top_produits=20, top_distributeurs=30):
+    # Les sept graphiques du rapport, dans l'ordre des exports de app2.py
+    revenus_par_produit = cube_view.aggregate("Revenu", "Produit")
+    revenu_mensuel = cube_view.aggregate("Revenu", "Mois")
+    return [
+        time_series_figure(cube_view.aggregate("Revenu", "Jour"), "Revenu Quotidien", "Date", "Revenu (TND)"),
+        top_products_figure(revenus_par_produit),
+        product_share_figure(revenus_par_produit),
+        heatmap_figure(cube_view.heatmap("Revenu", top_produits, top_distributeurs)),
+        monthly_bar_figure(revenu_mensuel),
+        monthly_line_figure(revenu_mensuel),
+        margin_box(cube_view, df_filtered),
+    ]
@@ -0,0 +1,348 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+from cache import LRUCache, content_hash
+
+# Budgets mémoire des deux caches ; au-delà, les entrées les moins récemment utilisées sont évincées
+QUERY_CACHE_BUDGET = int(os.environ.get("QUERY_CACHE_MB", "1024")) * 1024 * 1024
+AGGREGATION_MEMO_BUDGET = int(os.environ.get("AGGREGATION_MEMO_MB", "256")) * 1024 * 1024
+
+# Index et agrégats construits une fois par jeu de données, réutilisés à chaque rerun
+query_cache = LRUCache(budget_bytes=QUERY_CACHE_BUDGET, max_entries=16)
+# Résultats d'agrégation par (jeu de données, état des filtres, requête) :
+# KPIs et graphiques d'un même rerun — et des reruns suivants — partagent un seul calcul
+aggregation_memo = LRUCache(budget_bytes=AGGREGATION_MEMO_BUDGET, max_entries=1024)
+
+# Au-delà de ce nombre de modalités, les bitmaps coûteraient trop de mémoire :
+# la sélection passe par une table de correspondance sur les codes
+BITMAP_MAX_CATEGORIES = 256
+
+
+# ------------------------
+# INDEX DE FILTRAGE
+# ------------------------
+
+class DimensionIndex:
+    # Codes des lignes (dans l'ordre des dates) et bitmaps compressés par modalité
+
+    def __init__(self, values):
+        cat = pd.Categorical(values)
+        self.categories = cat.categories
+        self.codes = cat.codes
+        self.bitmaps = None
+        self.present = np.packbits(self.codes >= 0) if (self.codes < 0).any() else None
+        if len(self.categories) <= BITMAP_MAX_CATEGORIES:
+            order = np.argsort(self.codes, kind="stable")
+            bounds = np.searchsorted(self.codes[order], np.arange(len(self.categories) + 1))
+            self.bitmaps = []
+            for code in range(len(self.categories)):
+                mask = np.zeros(len(self.codes), dtype=bool)
+                mask[order[bounds[code]:bounds[code + 1]]] = True
+                self.bitmaps.append(np.packbits(mask))
+
+    def packed_mask(self, selected):
+        # None si toutes les modalités sont retenues (aucun filtre à appliquer)
+        wanted = self.categories.get_indexer(pd.Index(selected).unique())
+        wanted = wanted[wanted >= 0]
+        if len(wanted) == len(self.categories):
+            return None
+        if self.bitmaps is None:
+            lut = np.zeros(len(self.categories) + 1, dtype=bool)
+            lut[wanted] = True
+            # code -1 (valeur manquante) -> dernière case, jamais retenue
+            return np.packbits(lut[self.codes])
+        nbytes = (len(self.codes) + 7) // 8
+        # OU des bitmaps retenus, ou NON du OU des exclus si c'est plus court
+        invert = len(wanted) > len(self.categories) // 2
+        codes = np.setdiff1d(np.arange(len(self.categories)), wanted) if invert else wanted
+        packed = np.zeros(nbytes, dtype=np.uint8)
+        for code in codes:
+            np.bitwise_or(packed, self.bitmaps[code], out=packed)
+        if invert:
+            np.invert(packed, out=packed)
+            if self.present is not None:
+                np.bitwise_and(packed, self.present, out=packed)
+        return packed
+
+    @property
+    def nbytes(self):
+        bitmaps = sum(b.nbytes for b in self.bitmaps) if self.bitmaps is not None else 0
+        present = self.present.nbytes if self.present is not None else 0
+        return self.codes.nbytes + bitmaps + present + int(self.categories.memory_usage(deep=True))
+
+
+class FilterIndex:
+    # Permutation triant les lignes par date : une plage de dates devient une
+    # tranche obtenue par recherche dichotomique ; produits et distributeurs
+    # sont filtrés par opérations bit à bit sur les bitmaps.
+
+    def __init__(self, df):
+        dates = df["Date"].to_numpy(dtype="datetime64[ns]")
+        valid = np.flatnonzero(~np.isnat(dates))
+        self.order = valid[np.argsort(dates[valid], kind="stable")]
+        self.dates = dates[self.order]
+        self.produit = DimensionIndex(df["Produit"].to_numpy()[self.order])
+        self.distributeur = DimensionIndex(df["Distributeur"].to_numpy()[self.order])
+
+    @property
+    def nbytes(self):
+        return self.order.nbytes + self.dates.nbytes + self.produit.nbytes + self.distributeur.nbytes
+
+    @property
+    def min_date(self):
+        return pd.Timestamp(self.dates[0]).date() if len(self.dates) else None
+
+    @property
+    def max_date(self):
+        return pd.Timestamp(self.dates[-1]).date() if len(self.dates) else None
+
+    @property
+    def produits(self):
+        return self.produit.categories.tolist()
+
+    @property
+    def distributeurs(self):
+        return self.distributeur.categories.tolist()
+
+    def date_slice(self, start_date, end_date):
+        # Bornes incluses, à la journée comme dans le filtre d'origine
+        lo = np.searchsorted(self.dates, np.datetime64(start_date, "ns"), side="left")
+        hi = np.searchsorted(self.dates, np.datetime64(end_date + datetime.timedelta(days=1), "ns"), side="left")
+        return lo, max(lo, hi)
+
+    def positions(self, start_date, end_date, produits, distributeurs):
+        lo, hi = self.date_slice(start_date, end_date)
+        masks = [m for m in (self.produit.packed_mask(produits), self.distributeur.packed_mask(distributeurs))
+                 if m is not None]
+        if not masks:
+            return self.order[lo:hi]
+        packed = masks[0] if len(masks) == 1 else np.bitwise_and(masks[0], masks[1])
+        # Seuls les octets couvrant la tranche de dates sont décompressés
+        first = lo // 8
+        bits = np.unpackbits(packed[first:(hi + 7) // 8])[lo - first * 8:hi - first * 8].astype(bool)
+        return self.order[lo:hi][bits]
+
+    def filter(self, df, start_date, end_date, produits, distributeurs):
+        return df.take(self.positions(start_date, end_date, produits, distributeurs))
+
+
+def get_filter_index(dataset_key, df):
+    return query_cache.get_or_compute(("filter_index", dataset_key), lambda: FilterIndex(df))
+
+
+# ------------------------
+# CUBE D'AGRÉGATS
+# ------------------------
+
+CUBE_MEASURES = ["Revenu", "Marge"]
+# Heatmap produit × distributeur : taille bornée quel que soit le nombre de points de vente
+HEATMAP_TOP_PRODUITS = 20
+HEATMAP_TOP_DISTRIBUTEURS = 30
+HEATMAP_MAX_CELLS = 2500
+AUTRES_PREFIX = "Autres"
+AUTRES_LABEL = AUTRES_PREFIX + " ({})"
+CUBE_STATS = ["sum", "count", "min", "max"]
+
+
+class AggregationCube:
+    # Une cellule par (jour, produit, distributeur) avec, pour chaque mesure,
+    # somme / nombre de valeurs / min / max. Les cellules sont triées par jour.
+
+    def __init__(self, df):
+        dates = df["Date"].to_numpy(dtype="datetime64[ns]")
+        valid = ~np.isnat(dates)
+        produit = pd.Categorical(df["Produit"])
+        distributeur = pd.Categorical(df["Distributeur"])
+        self.produit_categories = produit.categories
+        self.distributeur_categories = distributeur.categories
+
+        rows = pd.DataFrame({
+            "day": dates[valid].astype("datetime64[D]").astype("int64"),
+            "p": produit.codes[valid],
+            "d": distributeur.codes[valid],
+        })
+        for measure in CUBE_MEASURES:
+            # Sommes en float64 même si la frame compacte stocke du float32
+            rows[measure] = df[measure].to_numpy(dtype="float64")[valid]
+        grouped = rows.groupby(["day", "p", "d"], sort=True)
+        cells = grouped[CUBE_MEASURES].agg(CUBE_STATS)
+        cells.columns = [f"{measure}_{stat}" for measure, stat in cells.columns]
+        cells["n"] = grouped.size()
+        cells = cells.reset_index()
+
+        self.day = cells["day"].to_numpy()
+        self.p = cells["p"].to_numpy()
+        self.d = cells["d"].to_numpy()
+        self.values = {col: cells[col].to_numpy() for col in cells.columns if col not in ("day", "p", "d")}
+
+    def __len__(self):
+        return len(self.day)
+
+    @property
+    def nbytes(self):
+        arrays = [self.day, self.p, self.d] + list(self.values.values())
+        return sum(a.nbytes for a in arrays)
+
+    def select(self, start_date, end_date, produits, distributeurs):
+        lo = np.searchsorted(self.day, np.datetime64(start_date, "D").astype("int64"), side="left")
+        hi = np.searchsorted(self.day, np.datetime64(end_date, "D").astype("int64"), side="right")
+        rows = np.arange(lo, max(lo, hi))
+        for codes, categories, selected in (
+            (self.p, self.produit_categories, produits),
+            (self.d, self.distributeur_categories, distributeurs),
+        ):
+            wanted = categories.get_indexer(pd.Index(selected).unique())
+            wanted = wanted[wanted >= 0]
+            if len(wanted) < len(categories):
+                lut = np.zeros(len(categories) + 1, dtype=bool)
+                lut[wanted] = True
+                rows = rows[lut[codes[rows]]]
+        return CubeView(self, rows)
+
+
+class CubeView:
+    # Sous-ensemble de cellules correspondant à un état des filtres
+
+    def __init__(self, cube, rows, memo_key=None):
+        self.cube = cube
+        self.rows = rows
+        self.memo_key = memo_key
+
+    def memoize(self, query, compute):
+        if self.memo_key is None:
+            return compute()
+        result = aggregation_memo.get_or_compute((self.memo_key, query), compute)
+        # Copie : l'appelant peut modifier le résultat sans altérer le cache
+        return result.copy() if isinstance(result, (pd.Series, pd.DataFrame, dict)) else result
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def nbytes(self):
+        # Le cube est compté dans query_cache : la vue ne possède que ses positions
+        return self.rows.nbytes if self.rows is not None else 0
+
+    def _keys(self, dim):
+        cube, rows = self.cube, self.rows
+        if dim == "Jour":
+            return pd.to_datetime(cube.day[rows], unit="D").rename("Date")
+        if dim == "Mois":
+            months = cube.day[rows].astype("datetime64[D]").astype("datetime64[M]")
+            return pd.DatetimeIndex(months.astype("datetime64[ns]"), name="Mois")
+        if dim == "Produit":
+            return pd.CategoricalIndex(pd.Categorical.from_codes(cube.p[rows], cube.produit_categories), name="Produit")
+        if dim == "Distributeur":
+            return pd.CategoricalIndex(
+                pd.Categorical.from_codes(cube.d[rows], cube.distributeur_categories), name="Distributeur"
+            )
+        raise KeyError(dim)
+
+    def _values(self, measure, stat):
+        col = "n" if measure == "n" else f"{measure}_{stat}"
+        return pd.Series(self.cube.values[col][self.rows])
+
+    def aggregate(self, measure, by, stat="sum"):
+        by = by if isinstance(by, str) else tuple(by)
+        return self.memoize(("aggregate", measure, by, stat), lambda: self._aggregate(measure, by, stat))
+
+    def _aggregate(self, measure, by, stat):
+        # Ré-agrégation des cellules : les sommes/comptes s'additionnent, min/max se combinent
+        how = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}[stat]
+        values = self._values(measure, stat)
+        keys = [self._keys(dim) for dim in ([by] if isinstance(by, str) else by)]
+        result = values.groupby(keys, observed=True, sort=True).agg(how)
+        result.name = measure
+        return result
+
+    def pivot(self, measure, index, columns, stat="sum"):
+        return self.aggregate(measure, [index, columns], stat).unstack(fill_value=0)
+
+    def heatmap(self, measure, top_produits=HEATMAP_TOP_PRODUITS, top_distributeurs=HEATMAP_TOP_DISTRIBUTEURS,
+                skip_produits=0, skip_distributeurs=0, max_cells=HEATMAP_MAX_CELLS):
+        args = (measure, top_produits, top_distributeurs, skip_produits, skip_distributeurs, max_cells)
+        return self.memoize(("heatmap",) + args, lambda: self._heatmap(*args))
+
+    def _heatmap(self, measure, top_produits, top_distributeurs, skip_produits, skip_distributeurs, max_cells):
+        # Matrice bornée construite à partir des seuls couples (produit, distributeur) présents :
+        # les N premiers de chaque axe (après les `skip_*` premiers, pour le détail d'un groupe)
+        # sont gardés, le reste est fusionné dans « Autres ».
+        sparse = self.aggregate(measure, ("Produit", "Distributeur"))
+        while (top_produits + 1) * (top_distributeurs + 1) > max_cells and max(top_produits, top_distributeurs) > 1:
+            if top_distributeurs >= top_produits:
+                top_distributeurs -= 1
+            else:
+                top_produits -= 1
+
+        labels = []
+        for level, top, skip in ((0, top_produits, skip_produits), (1, top_distributeurs, skip_distributeurs)):
+            ranking = sparse.groupby(level=level, observed=True).sum().sort_values(ascending=False).index
+            ranking = ranking.astype(str)
+            kept, rest = ranking[skip:skip + top], ranking[skip + top:]
+            mapping = pd.Series(AUTRES_LABEL.format(len(rest)), index=ranking)
+            mapping[kept] = kept
+            # Les éléments déjà détaillés (avant `skip`) sortent de la matrice
+            mapping[ranking[:skip]] = None
+            labels.append(mapping.reindex(sparse.index.get_level_values(level).astype(str)).to_numpy())
+
+        buckets = pd.Series(sparse.to_numpy(), index=pd.MultiIndex.from_arrays(labels, names=["Produit", "Distributeur"]))
+        buckets = buckets[pd.notna(labels[0]) & pd.notna(labels[1])]
+        matrix = buckets.groupby(level=[0, 1]).sum().unstack(fill_value=0)
+        # Tri par total décroissant, groupe « Autres » en dernier
+        row_order = matrix.sum(axis=1).sort_values(ascending=False).index
+        col_order = matrix.sum(axis=0).sort_values(ascending=False).index
+        row_order = [r for r in row_order if not r.startswith(AUTRES_PREFIX)] + [r for r in row_order if r.startswith(AUTRES_PREFIX)]
+        col_order = [c for c in col_order if not c.startswith(AUTRES_PREFIX)] + [c for c in col_order if c.startswith(AUTRES_PREFIX)]
+        return matrix.loc[row_order, col_order]
+
+    def totals(self):
+        return self.memoize(("totals",), self._totals)
+
+    def _totals(self):
+        out = {"n": int(self.cube.values["n"][self.rows].sum())}
+        for measure in CUBE_MEASURES:
+            values = self.cube.values
+            out[f"{measure}_sum"] = float(values[f"{measure}_sum"][self.rows].sum())
+            out[f"{measure}_count"] = int(values[f"{measure}_count"][self.rows].sum())
+            out[f"{measure}_min"] = float(np.nanmin(values[f"{measure}_min"][self.rows], initial=np.inf))
+            out[f"{measure}_max"] = float(np.nanmax(values[f"{measure}_max"][self.rows], initial=-np.inf))
+            count = out[f"{measure}_count"]
+            out[f"{measure}_mean"] = out[f"{measure}_sum"] / count if count else float("nan")
+        return out
+
+    def date_range(self):
+        return self.memoize(("date_range",), self._date_range)
+
+    def _date_range(self):
+        if not len(self.rows):
+            return None, None
+        days = self.cube.day[self.rows]
+        first, last = np.array([days.min(), days.max()]).astype("datetime64[D]").tolist()
+        return first, last
+
+
+def get_cube(dataset_key, df):
+    return query_cache.get_or_compute(("cube", dataset_key), lambda: AggregationCube(df))
+
+
+def filter_state_key(start_date, end_date, produits, distributeurs):
+    return content_hash(start_date, end_date, sorted(map(str, produits)), sorted(map(str, distributeurs)))
+
+
+def query_view(dataset_key, df, start_date, end_date, produits, distributeurs):
+    # Vue du cube pour un état des filtres, elle-même mémorisée
+    memo_key = (dataset_key, filter_state_key(start_date, end_date, produits, distributeurs))
+
+    def compute():
+        view = get_cube(dataset_key, df).select(start_date, end_date, produits, distributeurs)
+        view.memo_key = memo_key
+        return view
+
+    return aggregation_memo.get_or_compute((memo_key, "view"), compute)
+
+
+def aggregation_stats():
+    return aggregation_memo.stats()
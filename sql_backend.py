@@ -0,0 +1,250 @@
+import datetime
+import importlib.util
+import os
+import threading
+
+import pandas as pd
+
+from anomalies import MAX_TRAIN_ROWS, MIN_ROWS, RANDOM_STATE
+from charts import BOX_MAX_OUTLIERS
+from ingestion import CANONICAL_COLUMNS, DIMENSION_COLUMNS
+from queries import CUBE_MEASURES, CubeView, aggregation_memo, filter_state_key, query_cache
+
+# ------------------------
+# CHOIX DU MOTEUR
+# ------------------------
+
+# Historique local uniquement, dont les parties Arrow sont lues sur disque sans
+# passer par pandas. "auto" : pandas (index + cube en mémoire) pour un petit
+# historique, moteur SQL embarqué (DuckDB) au-delà de SQL_BACKEND_MIN_BYTES.
+# "pandas" ou "sql" forcent l'un ou l'autre. Un fichier seul, déjà chargé en
+# mémoire pour l'aperçu et la confirmation des colonnes, reste toujours sur pandas.
+QUERY_BACKEND = os.environ.get("QUERY_BACKEND", "auto")
+SQL_BACKEND_MIN_BYTES = int(os.environ.get("SQL_BACKEND_MIN_BYTES", 512 * 1024 ** 2))
+# Lignes lues par lot pour l'évaluation des anomalies
+SQL_BATCH_ROWS = 100_000
+TABLE = "contrats"
+
+
+def sql_available():
+    return importlib.util.find_spec("duckdb") is not None
+
+
+def choose_backend(n_bytes, backend=QUERY_BACKEND, threshold=SQL_BACKEND_MIN_BYTES):
+    # Sans DuckDB installé, le chemin pandas reste toujours utilisé
+    if backend == "pandas" or not sql_available():
+        return "pandas"
+    if backend == "sql" or n_bytes >= threshold:
+        return "sql"
+    return "pandas"
+
+
+# ------------------------
+# SOURCE SQL
+# ------------------------
+
+
+class SQLSource:
+    # Connexion DuckDB sur le dataset Arrow des parties de l'historique, lues à
+    # la demande : filtres et agrégations s'exécutent dans le moteur, seuls les
+    # résultats agrégés sont convertis en pandas. Mêmes propriétés que
+    # FilterIndex pour alimenter les filtres de la barre latérale.
+
+    def __init__(self, data):
+        import duckdb
+
+        self.con = duckdb.connect()
+        self.con.register(TABLE, data)
+        self._lock = threading.Lock()
+        bounds = self.fetch(f"SELECT MIN(Date)::DATE, MAX(Date)::DATE, COUNT(*) FROM {TABLE}")
+        self.min_date, self.max_date, self.rows = bounds[0]
+        self.produits = self._categories("Produit")
+        self.distributeurs = self._categories("Distributeur")
+
+    def __len__(self):
+        return self.rows
+
+    def fetch(self, sql, params=None):
+        with self._lock:
+            return self.con.execute(sql, params or []).fetchall()
+
+    def fetch_df(self, sql, params=None):
+        with self._lock:
+            return self.con.execute(sql, params or []).fetchdf()
+
+    def _categories(self, dim):
+        rows = self.fetch(f"SELECT DISTINCT {dim}::VARCHAR FROM {TABLE} WHERE {dim} IS NOT NULL ORDER BY 1")
+        return [row[0] for row in rows]
+
+    def where(self, start_date, end_date, produits, distributeurs):
+        # Bornes incluses, à la journée ; une dimension entièrement sélectionnée n'est pas filtrée
+        clauses = ["Date >= ?", "Date < ?"]
+        params = [pd.Timestamp(start_date), pd.Timestamp(end_date + datetime.timedelta(days=1))]
+        for dim, available, selected in (
+            ("Produit", self.produits, produits),
+            ("Distributeur", self.distributeurs, distributeurs),
+        ):
+            wanted = sorted(set(map(str, selected)) & set(available))
+            if len(wanted) < len(available):
+                clauses.append(f"list_contains(?, {dim}::VARCHAR)")
+                params.append(wanted)
+        return " AND ".join(clauses), params
+
+    def select(self, start_date, end_date, produits, distributeurs):
+        return SQLView(self, *self.where(start_date, end_date, produits, distributeurs))
+
+    def training_sample(self, n=MAX_TRAIN_ROWS):
+        # Échantillon borné pour l'entraînement du détecteur d'anomalies, tiré
+        # seulement quand aucun modèle n'est en cache pour ce jeu de données
+        columns = ", ".join(CANONICAL_COLUMNS)
+        return self.fetch_df(
+            f"SELECT {columns} FROM {TABLE} USING SAMPLE reservoir({int(n)} ROWS) REPEATABLE ({RANDOM_STATE})"
+        )
+
+
+def get_sql_source(dataset_key, data):
+    return query_cache.get_or_compute(("sql_source", dataset_key), lambda: SQLSource(data))
+
+
+# ------------------------
+# VUE FILTRÉE
+# ------------------------
+
+# Expressions de regroupement : mêmes noms d'index que les agrégats du cube
+SQL_DIMENSIONS = {
+    "Jour": ("Date::DATE", "Date"),
+    "Mois": ("date_trunc('month', Date)::DATE", "Mois"),
+    "Produit": ("Produit::VARCHAR", "Produit"),
+    "Distributeur": ("Distributeur::VARCHAR", "Distributeur"),
+}
+DATE_DIMENSIONS = {"Jour", "Mois"}
+
+
+def _measure_sql(measure, stat):
+    if measure == "n":
+        return "COUNT(*)"
+    value = f"{measure}::DOUBLE"
+    if stat == "sum":
+        # Somme vide = 0, comme la somme pandas
+        return f"COALESCE(SUM({value}), 0)"
+    return {"count": f"COUNT({value})", "min": f"MIN({value})", "max": f"MAX({value})"}[stat]
+
+
+class SQLView(CubeView):
+    # Interface de CubeView (aggregate, pivot, heatmap, totals, date_range, memoize),
+    # chaque agrégat étant une requête GROUP BY filtrée par le moteur SQL
+
+    def __init__(self, source, where, params, memo_key=None):
+        super().__init__(None, None, memo_key)
+        self.source = source
+        self.where = where
+        self.params = params
+
+    def __len__(self):
+        return self.totals()["n"]
+
+    def _aggregate(self, measure, by, stat):
+        dims = [by] if isinstance(by, str) else list(by)
+        exprs = [SQL_DIMENSIONS[dim] for dim in dims]
+        select = ", ".join(f"{expr} AS {name}" for expr, name in exprs)
+        group = ", ".join(str(i + 1) for i in range(len(dims)))
+        result = self.source.fetch_df(
+            f"SELECT {select}, {_measure_sql(measure, stat)} AS value FROM {TABLE} "
+            f"WHERE {self.where} GROUP BY {group} ORDER BY {group}",
+            self.params,
+        )
+        for dim, (_, name) in zip(dims, exprs):
+            if dim in DATE_DIMENSIONS:
+                result[name] = pd.to_datetime(result[name])
+            else:
+                result[name] = result[name].astype(object)
+        index = [name for _, name in exprs]
+        series = result.set_index(index[0] if len(index) == 1 else index)["value"]
+        series.name = measure
+        return series
+
+    def _totals(self):
+        stats = ["COUNT(*)"]
+        for measure in CUBE_MEASURES:
+            stats += [_measure_sql(measure, stat) for stat in ("sum", "count", "min", "max")]
+        row = self.source.fetch(f"SELECT {', '.join(stats)} FROM {TABLE} WHERE {self.where}", self.params)[0]
+        out = {"n": int(row[0])}
+        for i, measure in enumerate(CUBE_MEASURES):
+            total, count, low, high = row[1 + 4 * i:5 + 4 * i]
+            out[f"{measure}_sum"] = float(total)
+            out[f"{measure}_count"] = int(count)
+            out[f"{measure}_min"] = float(low) if low is not None else float("inf")
+            out[f"{measure}_max"] = float(high) if high is not None else float("-inf")
+            out[f"{measure}_mean"] = out[f"{measure}_sum"] / count if count else float("nan")
+        return out
+
+    def _date_range(self):
+        first, last = self.source.fetch(
+            f"SELECT MIN(Date)::DATE, MAX(Date)::DATE FROM {TABLE} WHERE {self.where}", self.params
+        )[0]
+        return first, last
+
+    def box_summary(self, by, value, max_outliers=BOX_MAX_OUTLIERS):
+        # Même résultat que charts.box_summary : quartiles, moustaches à 1,5 × IQR
+        # ramenées aux données et échantillon borné de points aberrants par groupe
+        return self.memoize(("box", by, value), lambda: self._box_summary(by, value, max_outliers))
+
+    def _box_summary(self, by, value, max_outliers):
+        expr, _ = SQL_DIMENSIONS[by]
+        base = (
+            f"WITH data AS (SELECT {expr} AS g, {value}::DOUBLE AS v FROM {TABLE} "
+            f"WHERE {self.where} AND {value} IS NOT NULL AND NOT isnan({value})), "
+            f"quartiles AS (SELECT g, quantile_cont(v, 0.25) AS q1, quantile_cont(v, 0.5) AS median, "
+            f"quantile_cont(v, 0.75) AS q3, COUNT(*) AS count FROM data GROUP BY g), "
+            f"flagged AS (SELECT data.g, data.v, v BETWEEN q1 - 1.5 * (q3 - q1) AND q3 + 1.5 * (q3 - q1) AS inside "
+            f"FROM data JOIN quartiles USING (g)) "
+        )
+        stats = self.source.fetch_df(
+            base + "SELECT q.g, q1, median, q3, count, lowerfence, upperfence FROM quartiles q "
+            "LEFT JOIN (SELECT g, MIN(v) AS lowerfence, MAX(v) AS upperfence FROM flagged WHERE inside GROUP BY g) f "
+            "USING (g) ORDER BY q.g",
+            self.params,
+        )
+        stats = stats.set_index("g").rename_axis(by)[["q1", "median", "q3", "count", "lowerfence", "upperfence"]]
+        per_group = max(1, max_outliers // max(len(stats), 1))
+        outliers = self.source.fetch_df(
+            base + "SELECT g, v FROM (SELECT g, v, row_number() OVER (PARTITION BY g ORDER BY hash(v)) AS pos "
+            "FROM flagged WHERE NOT inside) WHERE pos <= ? ORDER BY g",
+            self.params + [per_group],
+        ).rename(columns={"g": by, "v": value})
+        return stats, outliers
+
+    def _rows_sql(self):
+        return f"SELECT {', '.join(CANONICAL_COLUMNS)} FROM {TABLE} WHERE {self.where}"
+
+    def frame(self):
+        # Lignes filtrées complètes, à la demande seulement (export des données)
+        df = self.source.fetch_df(self._rows_sql(), self.params)
+        for col in DIMENSION_COLUMNS:
+            df[col] = df[col].astype("category")
+        return df
+
+    def detect_anomalies(self, detector, batch_rows=SQL_BATCH_ROWS):
+        # Lignes évaluées lot par lot : seules les lignes anormales sont conservées
+        if len(self) <= MIN_ROWS:
+            return pd.DataFrame()
+        found = []
+        with self.source._lock:
+            reader = self.source.con.execute(self._rows_sql(), self.params).fetch_record_batch(batch_rows)
+            for batch in reader:
+                rows = batch.to_pandas()
+                found.append(rows[detector.predict(rows)])
+        return pd.concat(found, ignore_index=True) if found else pd.DataFrame(columns=CANONICAL_COLUMNS)
+
+
+def sql_query_view(dataset_key, source, start_date, end_date, produits, distributeurs):
+    # Mémoïsée comme queries.query_view : KPIs et graphiques d'un état des filtres
+    # ne déclenchent chacun qu'une requête
+    memo_key = (dataset_key, filter_state_key(start_date, end_date, produits, distributeurs), "sql")
+
+    def compute():
+        view = source.select(start_date, end_date, produits, distributeurs)
+        view.memo_key = memo_key
+        return view
+
+    return aggregation_memo.get_or_compute((memo_key, "view"), compute)
@@ -0,0 +1,219 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cache import content_hash
+from ingestion import (
+    CANONICAL_COLUMNS,
+    DIMENSION_COLUMNS,
+    MEASURE_COLUMNS,
+    MEASURE_DTYPE,
+    file_digest,
+    ingestion_cache,
+    list_sheets,
+    load_preview,
+    read_csv_streaming,
+    read_excel_fast,
+    read_file,
+    standardize_columns,
+)
+from pipeline import COLUMN_SYNONYMS, detect_column
+
+# ------------------------
+# STOCKAGE LOCAL DE L'HISTORIQUE
+# ------------------------
+
+# Un fichier Arrow IPC (non compressé, donc projetable en mémoire) par export
+# importé, et un manifeste JSON. Seuls les fichiers jamais vus sont analysés ;
+# les contrats déjà présents dans l'historique sont écartés.
+DATA_STORE_DIR = os.environ.get("DATA_STORE_DIR", "data_store")
+ROW_HASH = "_row_hash"
+
+
+def normalize(df):
+    # Mêmes types quelle que soit la source (l'unité des dates varie entre CSV et Excel)
+    df = df[CANONICAL_COLUMNS].copy()
+    df["Date"] = df["Date"].astype("datetime64[ns]")
+    for col in MEASURE_COLUMNS:
+        df[col] = df[col].astype(MEASURE_DTYPE)
+    for col in DIMENSION_COLUMNS:
+        df[col] = df[col].astype(str).astype("category")
+    return df
+
+
+def row_hashes(df):
+    # Empreinte d'un contrat : toutes ses colonnes canoniques (frame normalisée)
+    return pd.util.hash_pandas_object(df[CANONICAL_COLUMNS], index=False).to_numpy()
+
+
+def new_rows_mask(hashes, existing):
+    # Déduplication en multiensemble : une ligne présente k fois dans le fichier
+    # et j fois dans l'historique n'est ajoutée que k - j fois (des contrats
+    # identiques peuvent exister dans un même export)
+    if not len(existing):
+        return np.ones(len(hashes), dtype=bool)
+    counts = pd.Series(existing).value_counts()
+    occurrence = pd.Series(hashes).groupby(hashes).cumcount().to_numpy()
+    already = pd.Series(hashes).map(counts).fillna(0).to_numpy()
+    return occurrence >= already
+
+
+def parse_file(name, data, columns_mapping, sheet_name=None):
+    # Lecture complète sans passer par le cache d'ingestion : la frame ne sert qu'à l'ajout
+    # L'historique ne garde que les colonnes canoniques (déduplication sur ces colonnes)
+    if name.endswith(".csv"):
+        return read_csv_streaming(data, columns_mapping, keep_extra=False)
+    if name.endswith(".xlsx"):
+        return read_excel_fast(data, columns_mapping, sheet_name, keep_extra=False)
+    return standardize_columns(read_file(name, data, sheet_name), columns_mapping, compact=True, keep_extra=False)
+
+
+def strict_mapping(name, df_cols):
+    # Sans confirmation possible, un fichier n'entre dans l'historique que si chaque
+    # champ est reconnu : pas de repli sur la première colonne comme dans l'aperçu
+    mapping = {key: detect_column(names, list(df_cols)) for key, names in COLUMN_SYNONYMS.items()}
+    missing = [key for key, col in mapping.items() if col is None]
+    if missing:
+        raise ValueError(
+            f"{name} : colonnes non reconnues ({', '.join(missing)}) ; "
+            "renommez-les dans l'export avant de l'ajouter à l'historique"
+        )
+    return mapping
+
+
+class DataStore:
+
+    def __init__(self, root=DATA_STORE_DIR):
+        self.root = Path(root)
+        self.parts = self.root / "parts"
+        self.manifest_path = self.root / "manifest.json"
+        self._lock = threading.Lock()
+
+    def manifest(self):
+        if not self.manifest_path.exists():
+            return []
+        return json.loads(self.manifest_path.read_text(encoding="utf-8"))
+
+    def _write_manifest(self, entries):
+        tmp = self.manifest_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(entries, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+
+    def version(self):
+        # Change à chaque ajout : clé des caches en aval (index, cube, détecteur)
+        return content_hash("store", str(self.root.resolve()), [e["digest"] for e in self.manifest()])
+
+    def __contains__(self, digest):
+        return any(e["digest"] == digest for e in self.manifest())
+
+    def _read_part(self, digest, columns=None):
+        import pyarrow as pa
+
+        with pa.memory_map(str(self.parts / f"{digest}.arrow"), "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        return table.select(columns) if columns else table
+
+    def _existing_hashes(self):
+        hashes = [self._read_part(e["digest"], [ROW_HASH]).column(0).to_numpy() for e in self.manifest()]
+        return np.concatenate(hashes) if hashes else np.zeros(0, dtype="uint64")
+
+    def add_file(self, name, data, sheet_name=None, columns_mapping=None):
+        # Renvoie l'entrée du manifeste (existante si le fichier est déjà importé)
+        import pyarrow as pa
+
+        digest = file_digest(data)
+        with self._lock:
+            for entry in self.manifest():
+                if entry["digest"] == digest:
+                    return dict(entry, status="déjà importé")
+
+            if name.endswith(".xlsx") and sheet_name is None:
+                sheet_name = list_sheets(data, digest)[0]
+            if columns_mapping is None:
+                columns_mapping = strict_mapping(name, load_preview(name, data, digest, sheet_name).columns)
+            start = time.perf_counter()
+            df = normalize(parse_file(name, data, columns_mapping, sheet_name))
+            if len(df) and df["Date"].isna().all():
+                raise ValueError(f"{name} : aucune date reconnue, colonnes à vérifier")
+
+            hashes = row_hashes(df)
+            keep = new_rows_mask(hashes, self._existing_hashes())
+            df = df[keep].reset_index(drop=True)
+            df[ROW_HASH] = hashes[keep]
+
+            self.parts.mkdir(parents=True, exist_ok=True)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            tmp = self.parts / f"{digest}.arrow.tmp"
+            with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp, self.parts / f"{digest}.arrow")
+
+            entry = {
+                "digest": digest,
+                "name": name,
+                "sheet": sheet_name,
+                "mapping": columns_mapping,
+                "rows": int(len(keep)),
+                "added": int(keep.sum()),
+                "duplicates": int((~keep).sum()),
+                "imported_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "parse_s": round(time.perf_counter() - start, 3),
+            }
+            self._write_manifest(self.manifest() + [entry])
+        return dict(entry, status="importé")
+
+    def load(self):
+        # Parties projetées en mémoire puis assemblées ; le résultat est mis en
+        # cache par version du stockage, l'analyse ne relit rien tant qu'aucun fichier n'est ajouté
+        import pyarrow as pa
+
+        def compute():
+            entries = self.manifest()
+            if not entries:
+                return pd.DataFrame({c: pd.Series(dtype=object) for c in CANONICAL_COLUMNS})
+            table = pa.concat_tables(
+                [self._read_part(e["digest"]) for e in entries], promote_options="permissive"
+            ).drop_columns([ROW_HASH])
+            df = table.to_pandas()
+            for col in DIMENSION_COLUMNS:
+                df[col] = df[col].astype("category")
+            return df
+
+        return ingestion_cache.get_or_compute(("store", self.version()), compute)
+
+    def nbytes(self):
+        # Taille des parties sur disque (Arrow non compressé : ~ taille en mémoire)
+        return sum((self.parts / f"{e['digest']}.arrow").stat().st_size for e in self.manifest())
+
+    def dataset(self):
+        # Parties vues comme un seul dataset Arrow projeté en mémoire, lu lot par lot
+        # par le moteur SQL ; les modalités sont lues en texte (dictionnaires propres à chaque partie)
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.fs as pafs
+
+        schema = pa.schema(
+            [("Date", pa.timestamp("ns"))]
+            + [(col, pa.string() if col in DIMENSION_COLUMNS else pa.float32()) for col in CANONICAL_COLUMNS[1:]]
+        )
+        paths = [str(self.parts / f"{e['digest']}.arrow") for e in self.manifest()]
+        return ds.dataset(paths, schema=schema, format="ipc", filesystem=pafs.LocalFileSystem(use_mmap=True))
+
+    def remove(self, digest):
+        with self._lock:
+            self._write_manifest([e for e in self.manifest() if e["digest"] != digest])
+            (self.parts / f"{digest}.arrow").unlink(missing_ok=True)
+
+    def clear(self):
+        with self._lock:
+            for entry in self.manifest():
+                (self.parts / f"{entry['digest']}.arrow").unlink(missing_ok=True)
+            self.manifest_path.unlink(missing_ok=True)
+
+
+data_store = DataStore()
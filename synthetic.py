@@ -0,0 +1,116 @@
+import argparse
+import datetime
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from exports import write_excel
+
+# Fichiers de contrats synthétiques et reproductibles (même graine, mêmes
+# données), avec une part réglable de valeurs « sales » comme dans les exports
+# réels des distributeurs.
+#   python synthetic.py --rows 1000000 --dirty 0.02 --output contrats.csv
+
+SOURCE_COLUMNS = {
+    "date": "Date de vente",
+    "revenu": "Prime Total TTC",
+    "marge": "Marge Distributeur TTC",
+    "produit": "Produit",
+    "assureur": "Part Assureur",
+    "distributeur": "Point de vente",
+}
+CSV_DATE_FORMAT = "%d/%m/%Y"
+
+# Variantes rencontrées dans les fichiers sources
+DIRTY_DATES = ["", "??/??/????", "31/02/2023", "2023-05-17", "17.05.2023", "45063", "n/a"]
+DIRTY_AMOUNTS = ["", "n/a", "1 234,56", "1.234,56 TND", "(12,50)", "250 DT", "12,5%", "-"]
+
+
+def _dirty(values, ratio, variants, rng):
+    # Remplace une part `ratio` des valeurs par des variantes tirées au hasard
+    if ratio <= 0:
+        return values
+    positions = np.flatnonzero(rng.random(len(values)) < ratio)
+    if not len(positions):
+        return values
+    out = values.astype(object)
+    out.iloc[positions] = rng.choice(np.array(variants, dtype=object), len(positions))
+    return out
+
+
+def generate_contracts(rows, products=40, distributors=500, start="2023-01-01", days=730,
+                       dirty_ratio=0.0, extra_columns=0, seed=0):
+    rng = np.random.default_rng(seed)
+    # Popularité inégale des produits et points de vente (loi de Zipf tronquée)
+    product_weights = 1 / np.arange(1, products + 1)
+    distributor_weights = 1 / np.arange(1, distributors + 1) ** 0.8
+    df = pd.DataFrame({
+        SOURCE_COLUMNS["date"]: pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, rows), unit="D"),
+        SOURCE_COLUMNS["revenu"]: rng.gamma(2.0, 150.0, rows).round(3),
+        SOURCE_COLUMNS["marge"]: rng.gamma(2.0, 20.0, rows).round(3),
+        SOURCE_COLUMNS["produit"]: pd.Categorical.from_codes(
+            rng.choice(products, rows, p=product_weights / product_weights.sum()),
+            [f"Produit {i}" for i in range(products)],
+        ).astype(str),
+        SOURCE_COLUMNS["assureur"]: rng.uniform(40, 80, rows).round(2),
+        SOURCE_COLUMNS["distributeur"]: pd.Categorical.from_codes(
+            rng.choice(distributors, rows, p=distributor_weights / distributor_weights.sum()),
+            [f"PDV {i}" for i in range(distributors)],
+        ).astype(str),
+    })
+    for i in range(extra_columns):
+        df[f"Champ {i}"] = rng.choice(["A", "B", "C", "D"], rows)
+
+    df[SOURCE_COLUMNS["date"]] = _dirty(df[SOURCE_COLUMNS["date"]], dirty_ratio, DIRTY_DATES, rng)
+    for key in ("revenu", "marge", "assureur"):
+        df[SOURCE_COLUMNS[key]] = _dirty(df[SOURCE_COLUMNS[key]], dirty_ratio, DIRTY_AMOUNTS, rng)
+    return df
+
+
+def contracts_bytes(df, fmt="csv"):
+    if fmt == "xlsx":
+        # Table de chaînes partagées, comme un classeur enregistré par Excel
+        return write_excel(df, sheet_name="Contrats", constant_memory=False)[0]
+    df = df.copy()
+    date_col = SOURCE_COLUMNS["date"]
+    if pd.api.types.is_object_dtype(df[date_col]):
+        df[date_col] = [
+            v.strftime(CSV_DATE_FORMAT) if isinstance(v, datetime.date) else v for v in df[date_col]
+        ]
+    return df.to_csv(index=False, date_format=CSV_DATE_FORMAT).encode("utf-8")
+
+
+def write_contracts(df, path):
+    path = Path(path)
+    path.write_bytes(contracts_bytes(df, "xlsx" if path.suffix.lower() == ".xlsx" else "csv"))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génération de fichiers de contrats synthétiques")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--distributors", type=int, default=500)
+    parser.add_argument("--start", default="2023-01-01")
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--dirty", type=float, default=0.0, help="part des valeurs sales (0 à 1)")
+    parser.add_argument("--extra-columns", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", nargs="+", default=["contrats.csv"], help="fichiers .csv et/ou .xlsx")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df = generate_contracts(
+        args.rows, args.products, args.distributors, args.start, args.days,
+        args.dirty, args.extra_columns, args.seed,
+    )
+    for output in args.output:
+        path = write_contracts(df, output)
+        print(f"{path} : {args.rows:,} lignes, {path.stat().st_size / 1e6:.1f} Mo")
+    print(f"Généré en {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
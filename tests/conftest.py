@@ -0,0 +1,30 @@
+import datetime
+import os
+import sys
+
+import pytest
+
+# Les modules de l'application sont à la racine du dépôt, sans paquet installable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def contracts():
+    # Export synthétique (octets CSV) et sa frame standardisée, partagés par les tests
+    from pipeline import detect_columns, load_dataset
+    from synthetic import contracts_bytes, generate_contracts
+
+    raw = generate_contracts(5000, products=12, distributors=40, days=400, seed=3)
+    data = contracts_bytes(raw, "csv")
+    mapping = detect_columns(list(raw.columns))
+    return {"raw": raw, "data": data, "mapping": mapping, "df": load_dataset("contrats.csv", data, mapping)}
+
+
+def filter_states(produits, distributeurs, min_date, max_date):
+    # Tous les filtres, une sous-période, un sous-ensemble de modalités, une sélection vide
+    return [
+        (min_date, max_date, produits, distributeurs),
+        (min_date + datetime.timedelta(days=30), max_date - datetime.timedelta(days=45), produits[:3], distributeurs[5:]),
+        (min_date, min_date + datetime.timedelta(days=10), produits[1:2], distributeurs),
+        (min_date, max_date, [], distributeurs),
+    ]
@@ -0,0 +1,86 @@
+import io
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import plotly.graph_objects as go
+import pytest
+
+import exports
+
+
+def make_figures(n):
+    return [go.Figure(go.Bar(x=["a", "b"], y=[1, i]), layout_title_text=f"Figure {i}") for i in range(n)]
+
+
+class FakeKaleido:
+    # Remplace le navigateur kaleido : compte les lancements et les rendus
+    opened = 0
+    rendered = 0
+
+    def __init__(self, n=1, **kwargs):
+        self.n = n
+
+    async def __aenter__(self):
+        FakeKaleido.opened += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def calc_fig(self, fig, opts=None):
+        FakeKaleido.rendered += 1
+        return f"{opts['format']}:{fig.layout.title.text}".encode()
+
+
+def test_batch_uses_one_browser_and_the_cache(monkeypatch):
+    import kaleido
+
+    monkeypatch.setattr(kaleido, "Kaleido", FakeKaleido)
+    monkeypatch.setattr(exports, "png_cache", exports.LRUCache(budget_bytes=1024 * 1024))
+    figs = make_figures(3)
+    steps = []
+    buffers = exports.render_figures(figs, progress=lambda frac, text: steps.append(frac))
+    assert [buf.getvalue() for buf in buffers] == [b"png:Figure 0", b"png:Figure 1", b"png:Figure 2"]
+    assert FakeKaleido.opened == 1 and FakeKaleido.rendered == 3
+    assert steps[0] == 0 and steps[-1] == 1
+
+    # Figures déjà rendues : aucun navigateur lancé
+    buffers = exports.render_figures(figs[:2])
+    assert [buf.getvalue() for buf in buffers] == [b"png:Figure 0", b"png:Figure 1"]
+    assert FakeKaleido.opened == 1 and FakeKaleido.rendered == 3
+
+
+def test_render_png():
+    from kaleido.errors import ChromeNotFoundError
+
+    try:
+        buffers = exports.render_figures(make_figures(2))
+    except ChromeNotFoundError:
+        pytest.skip("Chrome absent : rendu kaleido impossible")
+    assert len(buffers) == 2
+    for buf in buffers:
+        assert isinstance(buf, io.BytesIO)
+        assert buf.getvalue().startswith(b"\x89PNG")
+
+
+def test_write_excel_blocks_and_cell_types():
+    df = pd.DataFrame({
+        "Date": pd.to_datetime(["2024-03-05", None, "2024-03-07", "2024-03-08", "2024-03-09"]),
+        "Revenu": np.array([126.8, np.nan, np.inf, -np.inf, 1.5], dtype="float32"),
+        "Actif": [True, False, True, False, True],
+        "Produit": pd.Categorical(["A", "B", None, "A", "B"]),
+        "Divers": [1.5, "texte", pd.Timestamp("2024-01-02"), float("inf"), None],
+    })
+    data, sheets = exports.write_excel(df, rows_per_sheet=3, block_rows=2)
+    assert sheets == 2
+    workbook = openpyxl.load_workbook(io.BytesIO(data))
+    rows = [row for ws in workbook.worksheets for row in ws.iter_rows(min_row=2, values_only=True)]
+    assert [ws.title for ws in workbook.worksheets] == ["Analyse 1", "Analyse 2"]
+    assert rows == [
+        (pd.Timestamp("2024-03-05"), 126.8, True, "A", 1.5),
+        (None, None, False, "B", "texte"),
+        (pd.Timestamp("2024-03-07"), "inf", True, None, pd.Timestamp("2024-01-02")),
+        (pd.Timestamp("2024-03-08"), "-inf", False, "A", "inf"),
+        (pd.Timestamp("2024-03-09"), 1.5, True, "B", None),
+    ]
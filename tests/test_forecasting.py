@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from forecasting import FORECAST_HORIZON, MIN_MONTHS, forecast_segments
+
+
+def make_pivot(n_months=14):
+    months = pd.date_range("2023-01-01", periods=n_months, freq="MS", name="Mois")
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({"A": rng.uniform(100, 200, n_months), "B": rng.uniform(100, 200, n_months)}, index=months)
+
+
+def test_segment_with_missing_month_is_fitted():
+    pivot = make_pivot()
+    # Un mois sans vente pour A, un mois absent du pivot pour tous les segments
+    pivot.loc[pivot.index[5], "A"] = np.nan
+    pivot = pivot.drop(index=pivot.index[9])
+    table, report = forecast_segments(pivot, parallel=False)
+    assert report["failed"] == 0
+    assert report["fitted"] + report["cached"] == 2
+    expected_months = list(pd.date_range("2024-03-01", periods=FORECAST_HORIZON, freq="MS"))
+    for name in ("A", "B"):
+        forecast = table[table["Segment"] == name]
+        assert list(forecast["Mois"]) == expected_months
+        assert forecast["Prévision"].notna().all()
+
+
+def test_min_months_counts_months_with_sales():
+    pivot = make_pivot()
+    # A s'étend sur 14 mois mais n'a des ventes que sur MIN_MONTHS d'entre eux
+    pivot["A"] = pivot["A"].where(np.arange(len(pivot)) % 2 == 1)
+    pivot.loc[pivot.index[-1], "A"] = np.nan
+    assert pivot["A"].notna().sum() == MIN_MONTHS
+    table, report = forecast_segments(pivot, parallel=False)
+    assert report["skipped"] == 1
+    assert set(table["Segment"]) == {"B"}
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from parsing import parse_amounts, parse_dates
+
+
+def old_parse_dates(values):
+    # Conversion d'origine de standardize_columns, colonne entière
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), dayfirst=True, errors="coerce")
+    return parsed.astype("datetime64[ns]")
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        ["05/03/2024", "06/03/2024", "31/12/2024", ""],
+        ["05/03/2024 10:30", "13/03/2024 08:15", None],
+        ["5.3.2024", "13.12.2023"],
+    ],
+)
+def test_day_first_columns_match_old_parser(values):
+    parsed, failures = parse_dates(pd.Series(values, dtype=object))
+    pd.testing.assert_series_equal(parsed, old_parse_dates(values))
+    assert failures == 0
+
+
+def test_iso_column():
+    # L'ancienne conversion lisait ces dates jour en premier (2024-03-05 -> 3 mai)
+    values = ["2024-03-05", "2024-03-06 10:30:00", "2023-11-30", None]
+    parsed, failures = parse_dates(pd.Series(values, dtype=object))
+    expected = pd.to_datetime(pd.Series(values, dtype=object), format="ISO8601").astype("datetime64[ns]")
+    pd.testing.assert_series_equal(parsed, expected)
+    assert parsed[0] == pd.Timestamp("2024-03-05")
+    assert failures == 0
+
+
+def test_iso_dates_are_never_read_day_first():
+    # Quelques dates ISO au milieu d'un export jour/mois : analysées hors format dominant
+    values = ["05/03/2024"] * 10 + ["2024-03-05", "2024-01-02T08:00"]
+    parsed, failures = parse_dates(pd.Series(values, dtype=object))
+    assert parsed.iloc[-2] == pd.Timestamp("2024-03-05")
+    assert parsed.iloc[-1] == pd.Timestamp("2024-01-02 08:00")
+    assert failures == 0
+
+
+def test_excel_serials():
+    expected = pd.Timestamp("1899-12-30") + pd.to_timedelta([45000, 45351.5], unit="D")
+    parsed, failures = parse_dates(pd.Series([45000, 45351.5]))
+    assert list(parsed) == list(expected)
+    assert failures == 0
+    # Numéros de série en texte, mêlés à des dates
+    parsed, failures = parse_dates(pd.Series(["45000", "05/03/2024"], dtype=object))
+    assert list(parsed) == [expected[0], pd.Timestamp("2024-03-05")]
+
+
+def test_mixed_column_matches_old_parser_per_format():
+    # Chaque format jour en premier donne le même résultat que l'ancienne
+    # conversion appliquée à ses seules valeurs ; l'ISO reste année-mois-jour
+    groups = [
+        ["05/03/2024", "13/04/2024", "01/02/2023"],
+        ["5.3.2024", "13.12.2023"],
+    ]
+    iso = ["2024-03-05", "2023-11-30"]
+    values = [v for group in groups for v in group] + iso + ["pas une date", None, "  "]
+    parsed, failures = parse_dates(pd.Series(values, dtype=object))
+    expected = pd.concat([old_parse_dates(group) for group in groups], ignore_index=True)
+    pd.testing.assert_series_equal(parsed[: len(expected)], expected)
+    assert list(parsed[len(expected):len(expected) + 2]) == list(pd.to_datetime(iso))
+    parsed = parsed[len(expected) + 2:]
+    assert parsed.isna().all()
+    assert failures == 1
+
+
+def test_amounts():
+    values = ["1 234,56", "1.234.567", "1,234.5", "(12,5)", "100 TND", "", "abc", None]
+    parsed, failures = parse_amounts(pd.Series(values, dtype=object))
+    np.testing.assert_allclose(parsed[:5], [1234.56, 1234567, 1234.5, -12.5, 100])
+    assert parsed[5:].isna().all()
+    assert failures == 1
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import filter_states
+from queries import FilterIndex, get_filter_index, query_view
+
+
+def reference_filter(df, start_date, end_date, produits, distributeurs):
+    # Filtre d'origine (app.py) : masque booléen sur toute la frame
+    return df[
+        (df["Date"].dt.date >= start_date)
+        & (df["Date"].dt.date <= end_date)
+        & (df["Produit"].isin(produits))
+        & (df["Distributeur"].isin(distributeurs))
+    ]
+
+
+@pytest.fixture(scope="module")
+def indexed(contracts):
+    df = contracts["df"]
+    index = get_filter_index("test-queries", df)
+    return df, index, filter_states(index.produits, index.distributeurs, index.min_date, index.max_date)
+
+
+def test_filter_index_matches_boolean_mask(indexed):
+    df, index, states = indexed
+    for state in states:
+        expected = reference_filter(df, *state)
+        rows = index.filter(df, *state)
+        assert sorted(rows.index) == sorted(expected.index)
+
+
+def test_filter_index_skips_missing_dates():
+    df = pd.DataFrame({
+        "Date": pd.to_datetime(["2024-01-03", None, "2024-01-01"]),
+        "Produit": ["A", "B", "A"],
+        "Distributeur": ["X", "X", "Y"],
+    })
+    index = FilterIndex(df)
+    assert (index.min_date.isoformat(), index.max_date.isoformat()) == ("2024-01-01", "2024-01-03")
+    assert list(index.positions(index.min_date, index.max_date, ["A", "B"], ["X", "Y"])) == [2, 0]
+
+
+def test_cube_matches_filtered_rows(indexed):
+    df, index, states = indexed
+    for state in states:
+        rows = reference_filter(df, *state)
+        view = query_view("test-queries", df, *state)
+        totals = view.totals()
+        assert totals["n"] == len(rows)
+        for measure in ("Revenu", "Marge"):
+            values = rows[measure].astype("float64")
+            assert totals[f"{measure}_sum"] == pytest.approx(values.sum())
+            assert totals[f"{measure}_count"] == values.count()
+        if not len(rows):
+            assert view.date_range() == (None, None)
+            continue
+        assert view.date_range() == (rows["Date"].min().date(), rows["Date"].max().date())
+
+        by_product = rows.groupby("Produit", observed=True)["Revenu"].sum()
+        aggregated = view.aggregate("Revenu", "Produit")
+        assert list(aggregated.index) == list(by_product.index)
+        np.testing.assert_allclose(aggregated.to_numpy(), by_product.to_numpy(), rtol=1e-6)
+
+        months = rows["Date"].dt.to_period("M").dt.to_timestamp()
+        by_month = rows["Revenu"].astype("float64").groupby(months).max()
+        aggregated = view.aggregate("Revenu", "Mois", "max")
+        assert list(aggregated.index) == list(by_month.index)
+        np.testing.assert_allclose(aggregated.to_numpy(), by_month.to_numpy())
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from conftest import filter_states
+from queries import get_filter_index, query_view
+from sql_backend import choose_backend, get_sql_source, sql_query_view
+from store import DataStore
+
+# sql_backend n'importe DuckDB qu'à la création d'une source
+pytest.importorskip("duckdb")
+
+
+@pytest.fixture(scope="module")
+def backends(tmp_path_factory, contracts):
+    # Même historique vu par les deux moteurs : frame pandas chargée et dataset Arrow sur disque
+    store = DataStore(tmp_path_factory.mktemp("store"))
+    store.add_file("contrats.csv", contracts["data"])
+    key = store.version()
+    df = store.load()
+    return df, get_filter_index(key, df), get_sql_source(key, store.dataset()), key
+
+
+def test_choose_backend():
+    assert choose_backend(10, backend="auto", threshold=100) == "pandas"
+    assert choose_backend(100, backend="auto", threshold=100) == "sql"
+    assert choose_backend(10, backend="sql") == "sql"
+    assert choose_backend(10**12, backend="pandas") == "pandas"
+
+
+def test_filter_values_match(backends):
+    _, index, source, _ = backends
+    assert (source.min_date, source.max_date) == (index.min_date, index.max_date)
+    assert source.produits == index.produits
+    assert source.distributeurs == index.distributeurs
+
+
+def test_sql_views_match_pandas_cube(backends):
+    df, index, source, key = backends
+    for state in filter_states(index.produits, index.distributeurs, index.min_date, index.max_date):
+        cube_view = query_view(key, df, *state)
+        sql_view = sql_query_view(key, source, *state)
+        expected, actual = cube_view.totals(), sql_view.totals()
+        assert expected.keys() == actual.keys()
+        for name, value in expected.items():
+            assert actual[name] == pytest.approx(value, rel=1e-5, nan_ok=True), name
+        assert sql_view.date_range() == cube_view.date_range()
+        if not expected["n"]:
+            continue
+        for by in ("Jour", "Mois", "Produit", "Distributeur", ("Mois", "Produit")):
+            for stat in ("sum", "count", "min", "max"):
+                x, y = cube_view.aggregate("Revenu", by, stat), sql_view.aggregate("Revenu", by, stat)
+                assert [str(i) for i in x.index] == [str(i) for i in y.index], (by, stat)
+                np.testing.assert_allclose(x.to_numpy(), y.to_numpy(), rtol=1e-5)
+        heat_pandas, heat_sql = cube_view.heatmap("Revenu"), sql_view.heatmap("Revenu")
+        assert list(heat_pandas.index) == list(heat_sql.index)
+        np.testing.assert_allclose(heat_pandas.to_numpy(), heat_sql.to_numpy(), rtol=1e-5)
+        assert len(sql_view.frame()) == len(index.filter(df, *state))
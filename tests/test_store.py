@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from store import DataStore, new_rows_mask
+from synthetic import contracts_bytes
+
+
+def test_new_rows_mask_is_a_multiset_difference():
+    hashes = np.array([1, 2, 2, 3, 3, 3], dtype="uint64")
+    existing = np.array([2, 3, 3, 4], dtype="uint64")
+    assert new_rows_mask(hashes, existing).tolist() == [True, False, True, False, False, True]
+    assert new_rows_mask(hashes, np.zeros(0, dtype="uint64")).all()
+
+
+def test_overlapping_exports_are_deduplicated(tmp_path, contracts):
+    raw = contracts["raw"]
+    store = DataStore(tmp_path / "store")
+    first = store.add_file("janvier.csv", contracts_bytes(raw.iloc[:3000], "csv"))
+    assert (first["status"], first["added"], first["duplicates"]) == ("importé", 3000, 0)
+
+    # Deuxième export : 1 000 contrats déjà importés, 2 000 nouveaux, et un contrat en double dans le fichier
+    february = contracts_bytes(raw.iloc[list(range(2000, 5000)) + [4500]], "csv")
+    second = store.add_file("fevrier.csv", february)
+    assert (second["added"], second["duplicates"]) == (2001, 1000)
+    assert len(store.load()) == 5001
+
+    again = store.add_file("fevrier (copie).csv", february)
+    assert again["status"] == "déjà importé"
+    assert [e["name"] for e in store.manifest()] == ["janvier.csv", "fevrier.csv"]
+
+
+def test_unrecognized_columns_are_rejected(tmp_path, contracts):
+    raw = contracts["raw"].rename(columns={contracts["mapping"]["revenu"]: "Colonne inconnue"})
+    store = DataStore(tmp_path / "store")
+    with pytest.raises(ValueError, match="revenu"):
+        store.add_file("inconnu.csv", contracts_bytes(raw, "csv"))
+    assert store.manifest() == []